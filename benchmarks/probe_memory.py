@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Measures the peak memory used by probe_binary_info() for symbol files of
+increasing size. dump_syms is replaced by a stand-in printing a MODULE header
+followed by N lines, and each size is probed in a fresh process, so its peak
+RSS only reflects that probe. The peak RSS should stay flat as N grows, as
+only the header line is read.
+
+Usage: benchmarks/probe_memory.py [lines...]
+"""
+
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import generate_symbols  # noqa: E402
+
+DEFAULT_LINES = [1000, 2000000, 8000000]
+STAND_IN = """#!{python}
+import sys
+sys.stdout.write("MODULE Linux x86_64 0123456789ABCDEF0123456789ABCDEF0 sample\\n")
+chunk = "FILE 0 sample.c\\n" * 10000
+try:
+    for _ in range({lines} // 10000):
+        sys.stdout.write(chunk)
+    sys.stdout.write("FILE 0 sample.c\\n" * ({lines} % 10000))
+    sys.stdout.flush()
+except BrokenPipeError:
+    pass
+"""
+
+
+def probe(lines: int):
+    """Probes a stand-in printing |lines| lines and prints the peak RSS of
+    this process and the time spent."""
+    with tempfile.TemporaryDirectory() as directory:
+        dump_syms = Path(directory) / "dump_syms"
+        dump_syms.write_text(STAND_IN.format(python=sys.executable, lines=lines))
+        dump_syms.chmod(0o755)
+        binary = Path(directory) / "sample"
+        binary.write_bytes(os.urandom(4096))
+        start_time = time.monotonic()
+        binary_info = asyncio.run(generate_symbols.probe_binary_info(dump_syms, binary))
+        seconds = time.monotonic() - start_time
+    assert binary_info, "The stand-in header was not found."
+    # ru_maxrss is in KiB on Linux.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print("%-12d %8.1f MiB %8.2fs" % (lines, peak_rss, seconds))
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--probe":
+        probe(int(sys.argv[2]))
+        return
+    print("%-12s %12s %9s" % ("lines", "peak RSS", "time"))
+    for lines in [int(arg) for arg in sys.argv[1:]] or DEFAULT_LINES:
+        subprocess.run([sys.executable, __file__, "--probe", str(lines)], check=True)
+
+
+if __name__ == "__main__":
+    main()
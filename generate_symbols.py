@@ -7,20 +7,48 @@
 Currently, the tool only supports Linux, Android, and Mac. Support for other
 platforms is planned.
 """
+import asyncio
 import collections
+import concurrent.futures
+import contextlib
+import contextvars
 import errno
-import glob
+import fnmatch
+import functools
+import hashlib
+import heapq
+import http.client
+import math
+import mmap
 import multiprocessing
 from pathlib import Path
 import optparse
 import os
-import queue
 import re
 import shutil
+import signal
+import sqlite3
+import struct
 import subprocess
 import sys
+import tempfile
 import threading
+import time
 import traceback
+import urllib.parse
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 
 CONCURRENT_TASKS = multiprocessing.cpu_count()
@@ -32,9 +60,226 @@ if sys.platform == "win32":
 else:
     DUMP_SYMS = "dump_syms"
 
+# Where cgroup hierarchies are mounted, and the memory a dump_syms job is
+# assumed to need when sizing the default job count to a memory limit.
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+DEFAULT_JOB_MEMORY = 1024 * 1024 * 1024
+# cgroup v1 reports "no memory limit" as a huge page-aligned number.
+CGROUP_V1_NO_LIMIT = 1 << 60
+
 # The BINARY_INFO tuple describes a binary as dump_syms identifies it.
 BINARY_INFO = collections.namedtuple("BINARY_INFO", ["platform", "arch", "hash", "name"])
 
+ELF_MAGIC = b"\x7fELF"
+# ELF e_machine values and the architecture names dump_syms reports for them.
+ELF_ARCHS = {
+    3: "x86",
+    8: "mips",
+    20: "ppc",
+    21: "ppc64",
+    40: "arm",
+    62: "x86_64",
+    183: "arm64",
+    243: "riscv64",
+}
+SHT_DYNAMIC = 6
+SHT_NOTE = 7
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_NOTE = 4
+NT_GNU_BUILD_ID = 3
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+# Debian-style multiarch library directories for each ELF e_machine.
+ELF_MULTIARCH = {
+    3: "i386-linux-gnu",
+    40: "arm-linux-gnueabihf",
+    62: "x86_64-linux-gnu",
+    183: "aarch64-linux-gnu",
+    243: "riscv64-linux-gnu",
+}
+LD_SO_CACHE = "/etc/ld.so.cache"
+LD_SO_CACHE_MAGIC = b"glibc-ld.so.cache1.1"
+LD_SO_CACHE_OLD_MAGIC = b"ld.so-1.7.0"
+
+# The ELF_IMAGE tuple holds the parsed headers of a mapped ELF file.
+ELF_IMAGE = collections.namedtuple("ELF_IMAGE", ["data", "endian", "is_64", "machine", "sections", "segments"])
+ELF_SECTION = collections.namedtuple("ELF_SECTION", ["name", "type", "addr", "offset", "size", "link"])
+ELF_SEGMENT = collections.namedtuple("ELF_SEGMENT", ["type", "offset", "vaddr", "size"])
+# The ELF_DYNAMIC tuple holds what the dynamic loader needs from an ELF file
+# to load its dependencies. rpath and runpath are lists of unexpanded paths.
+ELF_DYNAMIC = collections.namedtuple("ELF_DYNAMIC", ["machine", "is_64", "soname", "needed", "rpath", "runpath"])
+
+# Thin Mach-O magics mapped to (struct byte order, is 64-bit).
+MACHO_MAGICS = {
+    b"\xfe\xed\xfa\xce": (">", False),
+    b"\xce\xfa\xed\xfe": ("<", False),
+    b"\xfe\xed\xfa\xcf": (">", True),
+    b"\xcf\xfa\xed\xfe": ("<", True),
+}
+FAT_MAGIC = b"\xca\xfe\xba\xbe"
+FAT_MAGIC_64 = b"\xca\xfe\xba\xbf"
+# Java class files share FAT_MAGIC; their version field is always >= 45.
+FAT_MAX_ARCHS = 44
+LC_LOAD_DYLIB = 0xC
+LC_ID_DYLIB = 0xD
+LC_UUID = 0x1B
+LC_LAZY_LOAD_DYLIB = 0x20
+LC_LOAD_WEAK_DYLIB = 0x80000018
+LC_RPATH = 0x8000001C
+LC_REEXPORT_DYLIB = 0x8000001F
+LC_LOAD_UPWARD_DYLIB = 0x80000023
+# The load commands of the libraries a Mach-O image links against, as listed
+# by `otool -L`.
+MACHO_DYLIB_COMMANDS = (
+    LC_LOAD_DYLIB,
+    LC_LAZY_LOAD_DYLIB,
+    LC_LOAD_WEAK_DYLIB,
+    LC_REEXPORT_DYLIB,
+    LC_LOAD_UPWARD_DYLIB,
+)
+CPU_SUBTYPE_MASK = 0x00FFFFFF
+# Mach-O cputype values, and (cputype, cpusubtype) pairs for the variants
+# that dump_syms names on their own.
+MACHO_ARCHS = {
+    7: "x86",
+    0x01000007: "x86_64",
+    12: "arm",
+    0x0100000C: "arm64",
+    0x0200000C: "arm64_32",
+    18: "ppc",
+    0x01000012: "ppc64",
+}
+MACHO_SUBTYPE_ARCHS = {
+    (0x01000007, 8): "x86_64h",
+    (0x0100000C, 2): "arm64e",
+    (12, 6): "armv6",
+    (12, 9): "armv7",
+    (12, 11): "armv7s",
+    (12, 12): "armv7k",
+}
+
+# The MACHO_IMAGE tuple holds the header of one Mach-O image (a thin file or
+# a slice of a universal binary) and its (cmd, offset, size) load commands.
+MACHO_IMAGE = collections.namedtuple("MACHO_IMAGE", ["data", "endian", "cputype", "cpusubtype", "commands"])
+
+PE_SIGNATURE = b"PE\0\0"
+PE32_MAGIC = 0x10B
+PE32_PLUS_MAGIC = 0x20B
+# IMAGE_FILE_HEADER Machine values and the architecture names dump_syms uses.
+PE_ARCHS = {
+    0x14C: "x86",
+    0x1C4: "arm",
+    0x8664: "x86_64",
+    0xAA64: "arm64",
+}
+IMAGE_DIRECTORY_ENTRY_IMPORT = 1
+IMAGE_DIRECTORY_ENTRY_DEBUG = 6
+IMAGE_DIRECTORY_ENTRY_DELAY_IMPORT = 13
+# (directory, descriptor size, offset of the DLL name RVA) of the import and
+# delay-load import tables.
+PE_IMPORT_TABLES = ((IMAGE_DIRECTORY_ENTRY_IMPORT, 20, 12), (IMAGE_DIRECTORY_ENTRY_DELAY_IMPORT, 32, 4))
+IMAGE_DEBUG_TYPE_CODEVIEW = 2
+CODEVIEW_RSDS = b"RSDS"
+
+# The PE_IMAGE tuple holds the headers of a mapped PE file. directories are
+# the (rva, size) data directories and sections the PE_SECTION table.
+PE_IMAGE = collections.namedtuple("PE_IMAGE", ["data", "machine", "directories", "sections"])
+PE_SECTION = collections.namedtuple("PE_SECTION", ["name", "rva", "virtual_size", "offset", "raw_size"])
+
+# DLLs always loaded from the system directory, as listed in the KnownDLLs
+# registry key of a stock Windows install, and the prefixes of API set
+# names, which are virtual and resolved by the loader itself.
+DEFAULT_KNOWN_DLLS = (
+    "advapi32.dll",
+    "clbcatq.dll",
+    "combase.dll",
+    "comdlg32.dll",
+    "coml2.dll",
+    "difxapi.dll",
+    "gdi32.dll",
+    "gdiplus.dll",
+    "imagehlp.dll",
+    "imm32.dll",
+    "kernel32.dll",
+    "msctf.dll",
+    "msvcrt.dll",
+    "normaliz.dll",
+    "nsi.dll",
+    "ntdll.dll",
+    "ole32.dll",
+    "oleaut32.dll",
+    "psapi.dll",
+    "rpcrt4.dll",
+    "sechost.dll",
+    "setupapi.dll",
+    "shcore.dll",
+    "shell32.dll",
+    "shlwapi.dll",
+    "user32.dll",
+    "wldap32.dll",
+    "wow64.dll",
+    "wow64cpu.dll",
+    "wow64win.dll",
+    "ws2_32.dll",
+)
+KNOWN_DLLS_KEY = r"SYSTEM\CurrentControlSet\Control\Session Manager\KnownDLLs"
+API_SET_PREFIXES = ("api-ms-", "ext-ms-")
+
+# The DEPENDENCY_GRAPH tuple holds the set of binaries reachable from a root
+# binary, and the edges from each of them to its direct dependencies.
+DEPENDENCY_GRAPH = collections.namedtuple("DEPENDENCY_GRAPH", ["nodes", "edges"])
+
+# The MACHO_LINKAGE tuple holds the install name (LC_ID_DYLIB) of a Mach-O
+# file, its unexpanded LC_RPATHs and the install names of the libraries it
+# links against.
+MACHO_LINKAGE = collections.namedtuple("MACHO_LINKAGE", ["dylib_id", "rpaths", "dylibs"])
+
+# The DUMP_JOB tuple is a unit of work for the symbol dumping workers. arch is
+# only set for slices of universal binaries, which are dumped one at a time.
+# weight is the number of bytes dump_syms is expected to process for it.
+DUMP_JOB = collections.namedtuple("DUMP_JOB", ["binary", "binary_info", "arch", "weight"])
+
+# Size of the reads of dump_syms output when streaming it to a file.
+DUMP_SYMS_READ_SIZE = 1024 * 1024
+
+# Assumed dump_syms peak RSS per weight byte until a run has been measured,
+# how often running dump_syms processes are sampled to measure it, and how
+# often jobs waiting for memory check whether it became available.
+DEFAULT_RSS_PER_WEIGHT = 3
+RSS_SAMPLE_INTERVAL = 0.2
+MEMORY_POLL_INTERVAL = 1.0
+SIZE_SUFFIXES = "KMGT"
+
+# The peak RSS measured across the dump_syms processes of the current job,
+# kept as a one-element list by the job's task; None when not measuring.
+JOB_PEAK_RSS = contextvars.ContextVar("JOB_PEAK_RSS", default=None)
+
+# Assumed dump_syms throughput, in weight bytes per second, until the run
+# history in the SymbolsCache provides a measured one.
+DEFAULT_DUMP_THROUGHPUT = 20 * 1024 * 1024
+
+# Chunk size used to copy remote cache entries, and seconds to wait for a
+# remote cache.
+REMOTE_CACHE_READ_SIZE = 1024 * 1024
+REMOTE_CACHE_TIMEOUT = 30
+# Threads hashing binaries next to the dump_syms processes. Hashing mapped
+# files is mostly bound by I/O, which a few threads saturate.
+HASH_THREADS = 4
+# Name of the algorithm of hash_file(), which prefixes its digests.
+HASH_ALGORITHM = "xxh3_128" if xxhash else "blake2b"
+# ioctl sharing the data of a file copy-on-write with another one, on Linux
+# filesystems supporting reflinks such as Btrfs and XFS.
+FICLONE = 0x40049409
+COPY_FILE_RANGE_SIZE = 1024 * 1024 * 1024
+# Seconds between attempts to take the lock of a symbol file held by another
+# process.
+LOCK_POLL_INTERVAL = 0.1
+
 
 def get_dump_syms_binary(dump_syms_path: str = None):
     """Returns the path to the dump_syms binary."""
@@ -48,8 +293,104 @@ def get_dump_syms_binary(dump_syms_path: str = None):
     return dump_syms_path
 
 
-def resolve(path, exe_path, loader_path, rpaths):
-    """Resolve a dyld path.
+def get_cgroup_dirs(controller: str):
+    """Returns the cgroup directories of this process that can hold limits
+    for |controller|, from its own cgroups up to the roots of their
+    hierarchies, as limits of ancestors apply too. Both the cgroup v2 unified
+    hierarchy and the v1 |controller| hierarchy are looked at."""
+    try:
+        with open("/proc/self/cgroup", "rt") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    dirs = []
+    for line in lines:
+        _, controllers, path = line.split(":", 2)
+        if not controllers:
+            roots = [CGROUP_ROOT, CGROUP_ROOT / "unified"]
+        elif controller in controllers.split(","):
+            roots = [CGROUP_ROOT / controllers, CGROUP_ROOT / controller]
+        else:
+            continue
+        for root in roots:
+            if not root.is_dir():
+                continue
+            directory = root / path.lstrip("/")
+            while directory != root and root in directory.parents:
+                if directory.is_dir():
+                    dirs.append(directory)
+                directory = directory.parent
+            dirs.append(root)
+            break
+    return dirs
+
+
+def get_cgroup_cpu_limit():
+    """Returns the number of CPUs the cgroup CPU quota of this process allows,
+    possibly fractional, or None if there is no quota."""
+    limits = []
+    for directory in get_cgroup_dirs("cpu"):
+        try:
+            if (directory / "cpu.max").exists():
+                quota, period = (directory / "cpu.max").read_text().split()[:2]
+                if quota != "max":
+                    limits.append(int(quota) / int(period))
+            elif (directory / "cpu.cfs_quota_us").exists():
+                quota = int((directory / "cpu.cfs_quota_us").read_text())
+                period = int((directory / "cpu.cfs_period_us").read_text())
+                if quota > 0:
+                    limits.append(quota / period)
+        except (OSError, ValueError, ZeroDivisionError):
+            continue
+    return min(limits) if limits else None
+
+
+def get_cgroup_memory_limit():
+    """Returns the cgroup memory limit of this process in bytes, or None if
+    there is no limit."""
+    limits = []
+    for directory in get_cgroup_dirs("memory"):
+        try:
+            if (directory / "memory.max").exists():
+                limit = (directory / "memory.max").read_text().strip()
+                if limit != "max":
+                    limits.append(int(limit))
+            elif (directory / "memory.limit_in_bytes").exists():
+                limit = int((directory / "memory.limit_in_bytes").read_text())
+                if limit < CGROUP_V1_NO_LIMIT:
+                    limits.append(limit)
+        except (OSError, ValueError):
+            continue
+    return min(limits) if limits else None
+
+
+def get_default_jobs():
+    """Returns the default number of parallel jobs, along with the list of
+    limits it was derived from: the CPU count, the CPU affinity mask, and the
+    CPU quota and memory limit of the cgroup the process runs in."""
+    jobs = CONCURRENT_TASKS
+    reasons = ["%d CPUs" % CONCURRENT_TASKS]
+    if hasattr(os, "sched_getaffinity"):
+        affinity = len(os.sched_getaffinity(0))
+        jobs = min(jobs, affinity)
+        reasons.append("affinity mask of %d CPUs" % affinity)
+    cpu_limit = get_cgroup_cpu_limit()
+    if cpu_limit:
+        jobs = min(jobs, max(1, math.ceil(cpu_limit)))
+        reasons.append("cgroup CPU quota of %.2f CPUs" % cpu_limit)
+    memory_limit = get_cgroup_memory_limit()
+    if memory_limit:
+        jobs = min(jobs, max(1, memory_limit // DEFAULT_JOB_MEMORY))
+        reasons.append(
+            "cgroup memory limit of %.1f GiB at %.1f GiB per job"
+            % (memory_limit / 1024 ** 3, DEFAULT_JOB_MEMORY / 1024 ** 3)
+        )
+    return jobs, reasons
+
+
+@functools.lru_cache(maxsize=None)
+def resolve(path, exe_path, loader_path, rpaths: tuple):
+    """Resolve a dyld path. Results are memoized, so |rpaths| is a tuple.
     @executable_path is replaced with |exe_path|
     @loader_path is replaced with |loader_path|
     @rpath is replaced with the first path in |rpaths| where the referenced file
@@ -107,120 +448,572 @@ def get_shared_library_dependenciesMac(binary, exe_path):
     #    "foo.dylib" in the current directory, dirname() would return an empty
     #    string, causing "@loader_path/foo" to incorrectly expand to "/foo".
     loader_path = binary.parent.resolve()
-    env = os.environ.copy()
-    otool = subprocess.check_output(['otool', "-lm", binary], env=env).decode("utf-8").splitlines()
+    linkage = read_macho_linkage(binary)
+    if not linkage:
+        return []
     rpaths = []
-    dylib_id = None
-    for idx, line in enumerate(otool):
-        if line.find("cmd LC_RPATH") != -1:
-            m = re.match(" *path (.*) \(offset .*\)$", otool[idx + 2])
-            rpath = m.group(1)
-            rpath = rpath.replace("@loader_path", str(loader_path))
-            rpath = rpath.replace("@executable_path", str(exe_path))
-            rpaths.append(rpath)
-        elif line.find("cmd LC_ID_DYLIB") != -1:
-            m = re.match(" *name (.*) \(offset .*\)$", otool[idx + 2])
-            dylib_id = m.group(1)
+    for rpath in linkage.rpaths:
+        rpath = rpath.replace("@loader_path", str(loader_path))
+        rpath = rpath.replace("@executable_path", str(exe_path))
+        rpaths.append(rpath)
+    rpaths = tuple(rpaths)
     # `man dyld` says that @rpath is resolved against a stack of LC_RPATHs from
     # all executable images leading to the load of the current module. This is
     # intentionally not implemented here, since we require that every .dylib
     # contains all the rpaths it needs on its own, without relying on rpaths of
     # the loading executables.
-    otool = subprocess.check_output(['otool', "-Lm", binary], env=env).decode("utf-8").splitlines()
-    lib_re = re.compile("\t(.*) \(compatibility .*\)$")
     deps = []
-    for line in otool:
-        m = lib_re.match(line)
-        if m:
-            # For frameworks and shared libraries, `otool -L` prints the LC_ID_DYLIB
-            # as the first line. Filter that out.
-            if m.group(1) == dylib_id:
-                continue
-            dep = resolve(m.group(1), exe_path, loader_path, rpaths)
-            if dep:
-                deps.append(os.path.normpath(dep))
-            else:
-                print(
-                    (
-                        "ERROR: failed to resolve %s, exe_path %s, loader_path %s, "
-                        "rpaths %s" % (m.group(1), exe_path, loader_path, ", ".join(rpaths))
-                    ),
-                    file=sys.stderr,
-                )
-                sys.exit(1)
+    for dylib in linkage.dylibs:
+        dep = resolve(dylib, exe_path, loader_path, rpaths)
+        if dep:
+            deps.append(os.path.normpath(dep))
+        else:
+            print(
+                (
+                    "ERROR: failed to resolve %s, exe_path %s, loader_path %s, "
+                    "rpaths %s" % (dylib, exe_path, loader_path, ", ".join(rpaths))
+                ),
+                file=sys.stderr,
+            )
+            sys.exit(1)
     return deps
 
 
-def get_shared_library_dependenciesLinux(binary):
+def parse_elf_dynamic(elf):
+    """Returns the ELF_DYNAMIC of |elf| from its dynamic section, found from
+    the section headers or, if they were stripped, from the PT_DYNAMIC
+    segment. Statically linked files have no dependencies."""
+    dynamic = next((s for s in elf.sections if s.type == SHT_DYNAMIC), None)
+    strtab_offset = None
+    if dynamic:
+        offset, size = dynamic.offset, dynamic.size
+        if dynamic.link < len(elf.sections):
+            strtab_offset = elf.sections[dynamic.link].offset
+    else:
+        segment = next((s for s in elf.segments if s.type == PT_DYNAMIC), None)
+        if not segment:
+            return ELF_DYNAMIC(elf.machine, elf.is_64, None, [], [], [])
+        offset, size = segment.offset, segment.size
+    entry_fmt = elf.endian + ("qQ" if elf.is_64 else "iI")
+    entry_size = struct.calcsize(entry_fmt)
+    entries = []
+    for entry_offset in range(offset, offset + size - entry_size + 1, entry_size):
+        tag, value = struct.unpack_from(entry_fmt, elf.data, entry_offset)
+        if tag == DT_NULL:
+            break
+        entries.append((tag, value))
+    if strtab_offset is None:
+        # DT_STRTAB is a virtual address, mapped back through PT_LOAD.
+        strtab = next((value for tag, value in entries if tag == DT_STRTAB), None)
+        for segment in elf.segments:
+            if strtab is None or segment.type != PT_LOAD:
+                continue
+            if segment.vaddr <= strtab < segment.vaddr + segment.size:
+                strtab_offset = segment.offset + strtab - segment.vaddr
+        if strtab_offset is None:
+            return None
+
+    def _String(value):
+        start = strtab_offset + value
+        return elf.data[start : elf.data.find(b"\0", start)].decode("utf-8", "replace")
+
+    soname = None
+    needed, rpath, runpath = [], [], []
+    for tag, value in entries:
+        if tag == DT_NEEDED:
+            needed.append(_String(value))
+        elif tag == DT_SONAME:
+            soname = _String(value)
+        elif tag == DT_RPATH:
+            rpath.extend(p for p in _String(value).split(":") if p)
+        elif tag == DT_RUNPATH:
+            runpath.extend(p for p in _String(value).split(":") if p)
+    return ELF_DYNAMIC(elf.machine, elf.is_64, soname, needed, rpath, runpath)
+
+
+@functools.lru_cache(maxsize=None)
+def read_elf_dynamic(path: str):
+    """Returns the ELF_DYNAMIC of the ELF file at the real path |path|, or
+    None if it is not a valid ELF file. Results are memoized, as the same
+    libraries are reached from many binaries."""
+    data = map_binary(path)
+    if data is None:
+        return None
+    with data:
+        elf = parse_elf(data)
+        try:
+            return parse_elf_dynamic(elf) if elf else None
+        except struct.error:
+            return None
+
+
+@functools.lru_cache(maxsize=None)
+def read_ld_so_cache(path: str = LD_SO_CACHE):
+    """Returns the libraries listed in the ld.so.cache at |path|, as a dict
+    mapping each library name to its paths in cache order. Both the current
+    format and the old format with the current one appended are read."""
+    libraries = collections.defaultdict(list)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return libraries
+    offset = 0
+    if data.startswith(LD_SO_CACHE_OLD_MAGIC):
+        nlibs = struct.unpack_from("<I", data, 12)[0]
+        offset = (16 + nlibs * 12 + 3) & ~3
+    if data[offset : offset + len(LD_SO_CACHE_MAGIC)] != LD_SO_CACHE_MAGIC:
+        return libraries
+    try:
+        nlibs = struct.unpack_from("<I", data, offset + 20)[0]
+        for i in range(nlibs):
+            _, key, value, _, _ = struct.unpack_from("<iIIIQ", data, offset + 48 + i * 24)
+            name = data[offset + key : data.find(b"\0", offset + key)].decode("utf-8", "replace")
+            library = data[offset + value : data.find(b"\0", offset + value)].decode("utf-8", "replace")
+            libraries[name].append(library)
+    except struct.error:
+        pass
+    return libraries
+
+
+def get_elf_default_dirs(dynamic):
+    """Returns the trusted directories the dynamic loader searches last for
+    libraries of the architecture of |dynamic|."""
+    dirs = []
+    multiarch = ELF_MULTIARCH.get(dynamic.machine)
+    if multiarch:
+        dirs += ["/lib/" + multiarch, "/usr/lib/" + multiarch]
+    if dynamic.is_64:
+        dirs += ["/lib64", "/usr/lib64"]
+    return dirs + ["/lib", "/usr/lib"]
+
+
+def expand_elf_search_path(paths: list, origin: str, dynamic):
+    """Expands the $ORIGIN, $LIB and $PLATFORM tokens of the RPATH, RUNPATH or
+    LD_LIBRARY_PATH entries |paths|, for an object in the |origin| directory.
+    """
+    lib = "lib64" if dynamic.is_64 else "lib"
+    platform = ELF_ARCHS.get(dynamic.machine, "")
+    expanded = []
+    for path in paths:
+        for token, value in (("ORIGIN", origin), ("LIB", lib), ("PLATFORM", platform)):
+            path = path.replace("${%s}" % token, value).replace("$" + token, value)
+        expanded.append(path)
+    return expanded
+
+
+def find_elf_library(name: str, dirs: list, dynamic):
+    """Returns the path of the first library called |name| in |dirs| that is
+    an ELF file of the same class and machine as |dynamic|, or None."""
+    for directory in dirs:
+        candidate = os.path.join(directory, name)
+        candidate_dynamic = read_elf_dynamic(os.path.realpath(candidate))
+        if (
+            candidate_dynamic
+            and candidate_dynamic.machine == dynamic.machine
+            and candidate_dynamic.is_64 == dynamic.is_64
+        ):
+            return os.path.normpath(candidate)
+    return None
+
+
+def get_shared_library_dependenciesLinux(binary, edges: dict = None):
     """Return absolute paths to all shared library dependencies of the binary.
-    This implementation assumes that we're running on a Linux system."""
-    ldd = subprocess.check_output(["ldd", binary]).decode("utf-8")
-    lib_re = re.compile("\t.* => (.+) \(.*\)$")
+    The ELF dynamic sections are read in-process and resolved in the order
+    the dynamic loader uses: the DT_RPATH of the object and its loaders (if
+    it has no DT_RUNPATH), LD_LIBRARY_PATH, its DT_RUNPATH, ld.so.cache and
+    the default directories. As with ldd, the result is the transitive
+    closure, breadth-first, and works for binaries of any architecture.
+    If |edges| is given, it is filled with the direct dependencies of each
+    object of the closure, as the paths they resolved to."""
+    binary = os.path.realpath(binary)
+    main = read_elf_dynamic(binary)
+    if not main:
+        return []
+    origin = os.path.dirname(binary)
+    ld_library_path = os.environ.get("LD_LIBRARY_PATH", "").replace(";", ":").split(":")
+    ld_library_path = expand_elf_search_path([p for p in ld_library_path if p], origin, main)
+    ld_so_cache = read_ld_so_cache()
+    default_dirs = get_elf_default_dirs(main)
+    # Libraries are loaded once per name, the first resolution wins.
+    loaded = {main.soname: binary} if main.soname else {}
+    seen = {binary}
     result = []
-    for line in ldd.splitlines():
-        m = lib_re.match(line)
-        if m:
-            result.append(os.path.abspath(m.group(1)))
+    q = collections.deque([(binary, main, [])])
+    while q:
+        path, dynamic, loader_rpaths = q.popleft()
+        origin = os.path.dirname(path)
+        rpaths = loader_rpaths
+        if not dynamic.runpath:
+            rpaths = expand_elf_search_path(dynamic.rpath, origin, dynamic) + loader_rpaths
+        runpaths = expand_elf_search_path(dynamic.runpath, origin, dynamic)
+        if edges is not None:
+            edges[path] = []
+        for name in dynamic.needed:
+            if edges is not None and loaded.get(name):
+                edges[path].append(os.path.abspath(loaded[name]))
+            if name in loaded:
+                continue
+            if "/" in name:
+                # ld.so opens such names as they are once their tokens are
+                # expanded, i.e. relative to the current directory.
+                expanded = expand_elf_search_path([name], origin, dynamic)[0]
+                dep = find_elf_library(expanded, [os.getcwd()], main)
+            else:
+                dep = (
+                    find_elf_library(name, rpaths if not dynamic.runpath else [], main)
+                    or find_elf_library(name, ld_library_path, main)
+                    or find_elf_library(name, runpaths, main)
+                    or find_elf_library(name, [os.path.dirname(p) for p in ld_so_cache.get(name, [])], main)
+                    or find_elf_library(name, default_dirs, main)
+                )
+            loaded[name] = dep
+            if not dep:
+                continue
+            if edges is not None:
+                edges[path].append(os.path.abspath(dep))
+            dep_realpath = os.path.realpath(dep)
+            dep_dynamic = read_elf_dynamic(dep_realpath)
+            if dep_realpath in seen or not dep_dynamic:
+                continue
+            seen.add(dep_realpath)
+            if dep_dynamic.soname:
+                loaded.setdefault(dep_dynamic.soname, dep)
+            result.append(os.path.abspath(dep))
+            q.append((dep, dep_dynamic, rpaths))
     return result
 
 
-def get_shared_library_dependenciesWindows(binary: Path):
-    cmd = ["dumpbin", "/DEPENDENTS", binary]
-    files = subprocess.run(cmd, capture_output=True).stdout.decode("utf-8")
-    pattern = r"(\w+\.dll)"
-    dll_names = re.findall(pattern, files)
+@functools.lru_cache(maxsize=None)
+def get_known_dlls():
+    """Returns the lowercase names of the KnownDLLs, read from the registry
+    when running on Windows."""
+    known_dlls = set(DEFAULT_KNOWN_DLLS)
+    try:
+        import winreg
+
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, KNOWN_DLLS_KEY) as key:
+            for i in range(winreg.QueryInfoKey(key)[1]):
+                value = winreg.EnumValue(key, i)[1]
+                if isinstance(value, str):
+                    known_dlls.add(value.lower())
+    except (ImportError, OSError):
+        pass
+    return known_dlls
+
+
+@functools.lru_cache(maxsize=None)
+def list_dlls(directory: str):
+    """Returns the files in |directory| as a dict from lowercase name to
+    path, listing the directory only once per run."""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name.lower(): Path(entry.path) for entry in entries}
+    except OSError:
+        return {}
+
+
+@functools.lru_cache(maxsize=None)
+def get_dll_search_index():
+    """Returns the case-insensitive index of the DLLs found in the directories
+    searched after the application directory, in the order of the standard
+    (safe) search: the system directory, the 16-bit system directory, the
+    Windows directory, the current directory and PATH. The index maps each
+    lowercase name to the first match and is shared by the whole run."""
+    dirs = []
+    system_root = os.environ.get("SystemRoot")
+    if system_root:
+        dirs += [os.path.join(system_root, "System32"), os.path.join(system_root, "System"), system_root]
+    dirs.append(os.getcwd())
+    dirs += [d for d in os.environ.get("PATH", "").split(os.pathsep) if d]
+    index = {}
+    for directory in dirs:
+        for name, path in list_dlls(directory).items():
+            index.setdefault(name, path)
+    return index
+
+
+def get_shared_library_dependenciesWindows(binary: Path, exe_path: Path):
+    """Return absolute paths to all shared library dependencies of the binary.
+    Imports are read from the PE import tables, and resolved against the
+    application directory, the directory of the binary and the shared
+    get_dll_search_index(). API sets and KnownDLLs are always provided by the
+    system, so they are not looked up."""
+    dll_names = read_pe_imports(binary)
+    known_dlls = get_known_dlls()
+    search_dirs = [list_dlls(str(exe_path)), list_dlls(str(Path(binary).parent)), get_dll_search_index()]
     dll_files = []
     for dll_name in dll_names:
-        for path_dir in os.environ["PATH"].split(";") + [Path(binary).parent]:
-            dll_file = Path(path_dir) / dll_name
-            if dll_file.exists():
-                dll_files.append(dll_file)
+        dll_name = dll_name.lower()
+        if dll_name.startswith(API_SET_PREFIXES) or dll_name in known_dlls:
+            continue
+        for dlls in search_dirs:
+            if dll_name in dlls:
+                dll_files.append(dlls[dll_name])
+                break
     return [p.resolve() for p in dll_files]
 
 
-def get_shared_library_dependencies(binary: Path, exe_path: Path, platform: str):
-    """Return absolute paths to all shared library dependencies of the binary."""
+def get_shared_library_dependencies(binary: Path, exe_path: Path, platform: str, dependency_filter=None):
+    """Return absolute paths to all shared library dependencies of the binary
+    accepted by |dependency_filter|, which defaults to those in the build
+    directory, see get_default_dependency_filter()."""
     deps = []
     if platform == "linux":
         deps = get_shared_library_dependenciesLinux(binary)
     elif platform == "darwin":
         deps = get_shared_library_dependenciesMac(binary, exe_path)
     elif platform == "win32":
-        deps = get_shared_library_dependenciesWindows(binary)
+        deps = get_shared_library_dependenciesWindows(binary, exe_path)
     else:
         print("Platform not supported.")
         sys.exit(1)
-    result = []
-    build_dir = exe_path.parent
-    for dep in deps:
-        dep = Path(dep)
-        if dep.exists() and str(dep.parent).startswith(str(build_dir)):
-            result.append(dep)
-    return result
+    return filter_dependencies(deps, dependency_filter or get_default_dependency_filter(exe_path.parent))
 
 
-def get_transitive_dependencies(binary: Path, platform: str):
-    """Return absolute paths to the transitive closure of all shared library
-    dependencies of the binary, along with the binary itself."""
+def compile_path_patterns(patterns: list):
+    """Returns a compiled regular expression matching the paths matched by any
+    of |patterns|, or None if there are none. A pattern is either a glob,
+    where a path without wildcards also matches everything under it, or a
+    regular expression prefixed with "re:", which is searched in the path.
+    Globs are relative to the current directory unless they start with a
+    wildcard, as in */test/*."""
+    regexes = []
+    for pattern in patterns:
+        if pattern.startswith("re:"):
+            regexes.append(r"(?s:.*?(?:%s))" % pattern[3:])
+            continue
+        if not any(c in pattern for c in "*?["):
+            pattern = os.path.realpath(os.path.expanduser(pattern))
+        elif pattern[0] not in "*?[":
+            pattern = os.path.abspath(os.path.expanduser(pattern))
+        pattern = os.path.normcase(pattern)
+        regexes.append(fnmatch.translate(pattern))
+        regexes.append(fnmatch.translate(os.path.join(pattern, "*")))
+    return re.compile("|".join(regexes)) if regexes else None
+
+
+class DependencyFilter:
+    """Decides which dependencies get their symbols dumped, by matching their
+    resolved paths against the |include| and |exclude| patterns, see
+    compile_path_patterns(). Excludes win over includes, and with
+    |system_libraries| every dependency that is not excluded is included.
+    Each path is only matched once, however many binaries depend on it."""
+
+    def __init__(self, include: list = (), exclude: list = (), system_libraries: bool = False):
+        self._include = compile_path_patterns(include)
+        self._exclude = compile_path_patterns(exclude)
+        self._system_libraries = system_libraries
+        self._matches = {}
+        # Identifies the filter in the closure manifests it produced.
+        self.description = repr((sorted(include), sorted(exclude), system_libraries))
+
+    def is_included(self, path):
+        """Returns whether |path| matches the include patterns and none of the
+        exclude ones, rather than being accepted as a system library."""
+        realpath = os.path.normcase(os.path.realpath(path))
+        if self._exclude and self._exclude.match(realpath):
+            return False
+        return bool(self._include and self._include.match(realpath))
+
+    def __call__(self, path):
+        path = str(path)
+        match = self._matches.get(path)
+        if match is None:
+            realpath = os.path.normcase(os.path.realpath(path))
+            match = (
+                os.path.exists(realpath)
+                and not (self._exclude and self._exclude.match(realpath))
+                and (self._system_libraries or bool(self._include and self._include.match(realpath)))
+            )
+            self._matches[path] = match
+        return match
+
+
+@functools.lru_cache(maxsize=None)
+def get_default_dependency_filter(build_dir: Path):
+    """Returns the DependencyFilter including only the dependencies within
+    |build_dir|, the parent of the directory of the root binary."""
+    return DependencyFilter(include=[str(build_dir)])
+
+
+def filter_dependencies(deps: list, dependency_filter: DependencyFilter):
+    """Returns the paths of |deps| that exist and are accepted by
+    |dependency_filter|."""
+    return [Path(dep) for dep in deps if dependency_filter(dep)]
+
+
+@functools.lru_cache(maxsize=None)
+def get_cached_shared_library_dependencies(binary: Path, exe_path: Path, platform: str, dependency_filter=None):
+    """Memoized get_shared_library_dependencies(), for real paths, so every
+    library is only inspected once however many binaries depend on it."""
+    return tuple(get_shared_library_dependencies(binary, exe_path, platform, dependency_filter))
+
+
+def get_dependency_environment(platform: str):
+    """Returns a string identifying what, besides the binaries themselves, the
+    dependency resolution on |platform| depends on: the library search path
+    variables, the current directory, against which dependencies named with
+    a path are looked up, and, on Linux, the ld.so.cache."""
+    if platform == "linux":
+        try:
+            ld_so_cache_mtime = os.stat(LD_SO_CACHE).st_mtime_ns
+        except OSError:
+            ld_so_cache_mtime = 0
+        values = [os.environ.get("LD_LIBRARY_PATH", ""), ld_so_cache_mtime, os.getcwd()]
+    elif platform == "win32":
+        values = [os.environ.get("SystemRoot", ""), os.getcwd(), os.environ.get("PATH", "")]
+    else:
+        values = []
+    return "\n".join(str(value) for value in values)
+
+
+def get_linkage(binary: Path, platform: str):
+    """Returns a string describing how |binary| links to its dependencies, if
+    its direct dependencies cannot be resolved on their own: on Linux they
+    depend on the whole load order, but a rebuilt object with the same ELF
+    dynamic section resolves to the same libraries."""
+    if platform == "linux":
+        return repr(read_elf_dynamic(os.path.realpath(binary)))
+    return ""
+
+
+def get_unchanged_edges(manifest: dict, platform: str):
+    """Returns the edges of the closure |manifest| (see
+    SymbolsCache.lookup_closure()) that are still valid, along with the number
+    of its nodes whose file key changed. Changed nodes are left out for them
+    to be rescanned, except on Linux, where their edges are kept if their
+    linkage did not change, as any other change means resolving the whole
+    closure again. Returns None if the manifest has to be discarded."""
+    edges = {}
+    changed = 0
+    for path, (file_key, linkage, deps) in manifest.items():
+        try:
+            unchanged = get_file_key(path) == file_key
+        except OSError:
+            return None
+        if not unchanged:
+            changed += 1
+            if platform != "linux":
+                continue
+            if get_linkage(path, platform) != linkage:
+                return None
+        edges[Path(path)] = [Path(dep) for dep in deps]
+    return edges, changed
+
+
+def get_dependency_graph(
+    binary: Path, platform: str, jobs: int = CONCURRENT_TASKS, cache=None, dependency_filter=None
+):
+    """Returns the DEPENDENCY_GRAPH of the binary: the transitive closure of
+    its shared library dependencies accepted by |dependency_filter| along
+    with the binary itself, and the direct dependencies of each of them. With
+    |cache|, the graph is recorded in the closure manifest of that
+    SymbolsCache, and later calls only rescan the nodes whose file key
+    changed since, see get_unchanged_edges()."""
+    dependency_filter = dependency_filter or get_default_dependency_filter(binary.parent.parent)
+    if not cache:
+        return scan_dependency_graph(binary, platform, jobs, dependency_filter=dependency_filter)
+    environment = get_dependency_environment(platform) + "\n" + dependency_filter.description
+    manifest = cache.lookup_closure(binary, platform, environment)
+    known_edges, changed = (manifest and get_unchanged_edges(manifest, platform)) or (None, None)
+    if known_edges is not None and len(known_edges) == len(manifest):
+        graph = DEPENDENCY_GRAPH(set(known_edges), known_edges)
+        if not changed:
+            return graph
+    else:
+        graph = scan_dependency_graph(
+            binary, platform, jobs, known_edges if platform != "linux" else None, dependency_filter
+        )
+    nodes = []
+    for node in graph.nodes:
+        deps = [str(dep) for dep in graph.edges.get(node, [])]
+        nodes.append((str(node), get_file_key(node), get_linkage(node, platform), deps))
+    cache.store_closure(binary, platform, environment, nodes)
+    return graph
+
+
+def scan_dependency_graph(
+    binary: Path, platform: str, jobs: int = CONCURRENT_TASKS, known_edges: dict = None, dependency_filter=None
+):
+    """Computes the DEPENDENCY_GRAPH of the binary. On darwin and win32, where
+    every library has to be inspected on its own, the frontier of the walk is
+    expanded by up to |jobs| threads, and the direct dependencies of the
+    nodes in |known_edges| are taken from there instead."""
     exe_path = binary.parent
+    dependency_filter = dependency_filter or get_default_dependency_filter(exe_path.parent)
     if platform == "linux":
-        # 'ldd' returns all transitive dependencies for us.
-        deps = set(get_shared_library_dependencies(binary, exe_path, platform))
-        deps.add(binary)
-        return list(deps)
+        # The ELF resolver walks the whole graph for us.
+        elf_edges = {}
+        nodes = set(get_shared_library_dependenciesLinux(binary, elf_edges))
+        nodes = set(filter_dependencies(nodes, dependency_filter))
+        nodes.add(binary)
+        edges = {}
+        for path, deps in elf_edges.items():
+            path = binary if os.path.realpath(path) == os.path.realpath(binary) else Path(path)
+            if path in nodes:
+                edges[path] = [Path(dep) for dep in deps if Path(dep) in nodes]
+        return DEPENDENCY_GRAPH(nodes, edges)
     elif platform in ["darwin", "win32"]:
-        binaries = set([binary])
-        q = [binary]
-        while q:
-            deps = get_shared_library_dependencies(q.pop(0), exe_path, platform)
-            new_deps = set(deps) - binaries
-            binaries |= new_deps
-            q.extend(list(new_deps))
-        return binaries
+        nodes = set([binary])
+        realpaths = set([os.path.realpath(binary)])
+        edges = {}
+        frontier = collections.deque([binary])
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            pending = {}
+            while frontier or pending:
+                while frontier:
+                    node = frontier.popleft()
+                    if known_edges and node in known_edges:
+                        future = concurrent.futures.Future()
+                        future.set_result(known_edges[node])
+                    else:
+                        realpath = Path(os.path.realpath(node))
+                        future = pool.submit(
+                            get_cached_shared_library_dependencies, realpath, exe_path, platform, dependency_filter
+                        )
+                    pending[future] = node
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    node = pending.pop(future)
+                    edges[node] = list(future.result())
+                    for dep in edges[node]:
+                        realpath = os.path.realpath(dep)
+                        if realpath not in realpaths:
+                            realpaths.add(realpath)
+                            nodes.add(dep)
+                            frontier.append(dep)
+        return DEPENDENCY_GRAPH(nodes, edges)
     print("Platform not supported.")
     sys.exit(1)
 
 
+def get_transitive_dependencies(
+    binary: Path, platform: str, jobs: int = CONCURRENT_TASKS, cache=None, dependency_filter=None
+):
+    """Return absolute paths to the transitive closure of all shared library
+    dependencies of the binary, along with the binary itself."""
+    return list(get_dependency_graph(binary, platform, jobs, cache, dependency_filter).nodes)
+
+
+def get_all_transitive_dependencies(
+    binaries: list, platform: str, jobs: int = CONCURRENT_TASKS, cache=None, dependency_filter=None
+):
+    """Returns the union of the transitive closures of |binaries|, listing
+    each file once however many of them depend on it. The libraries they
+    share are only inspected once, see get_cached_shared_library_dependencies()
+    and read_elf_dynamic()."""
+    result = []
+    realpaths = set()
+    for binary in binaries:
+        for dep in get_transitive_dependencies(binary, platform, jobs, cache, dependency_filter):
+            realpath = os.path.realpath(dep)
+            if realpath not in realpaths:
+                realpaths.add(realpath)
+                result.append(dep)
+    return result
+
+
 def get_binary_info_from_header_info(header_info):
     """Given a standard symbol header information line, returns BINARY_INFO."""
     # header info is of the form "MODULE $PLATFORM $ARCH $HASH $BINARY"
@@ -230,6 +1023,1341 @@ def get_binary_info_from_header_info(header_info):
     return BINARY_INFO(*info_split[1:])
 
 
+def map_binary(binary: Path):
+    """Returns a read-only mmap of |binary|, or None if it is empty or cannot
+    be read."""
+    try:
+        with open(binary, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+
+def format_module_id(identifier: bytes, age: int, little_endian: bool):
+    """Formats a 16-byte identifier as a Breakpad module ID. As in a GUID, the
+    first three fields are printed big-endian, so they are byte-swapped if
+    |little_endian|, followed by the age in lowercase hexadecimal as dump_syms
+    does for PDB ages."""
+    identifier = identifier[:16].ljust(16, b"\0")
+    if little_endian:
+        identifier = identifier[3::-1] + identifier[5:3:-1] + identifier[7:5:-1] + identifier[8:]
+    return "%s%x" % (identifier.hex().upper(), age)
+
+
+def parse_elf(data):
+    """Parses the ELF, section and program headers of the mapped file |data|.
+    Returns an ELF_IMAGE, or None if |data| is not a valid ELF file."""
+    if data[:4] != ELF_MAGIC or data[4] not in (1, 2) or data[5] not in (1, 2):
+        return None
+    is_64 = data[4] == 2
+    endian = "<" if data[5] == 1 else ">"
+    try:
+        if is_64:
+            header = struct.unpack_from(endian + "HHIQQQIHHHHHH", data, 16)
+            shdr_fmt, phdr_fmt = endian + "IIQQQQIIQQ", endian + "IIQQQQQQ"
+        else:
+            header = struct.unpack_from(endian + "HHIIIIIHHHHHH", data, 16)
+            shdr_fmt, phdr_fmt = endian + "IIIIIIIIII", endian + "IIIIIIII"
+        machine, phoff, shoff = header[1], header[4], header[5]
+        phentsize, phnum, shentsize, shnum, shstrndx = header[8:13]
+        segments = []
+        for i in range(phnum):
+            phdr = struct.unpack_from(phdr_fmt, data, phoff + i * phentsize)
+            if is_64:
+                p_type, p_offset, p_vaddr, p_filesz = phdr[0], phdr[2], phdr[3], phdr[5]
+            else:
+                p_type, p_offset, p_vaddr, p_filesz = phdr[0], phdr[1], phdr[2], phdr[4]
+            segments.append(ELF_SEGMENT(p_type, p_offset, p_vaddr, p_filesz))
+        raw_sections = [struct.unpack_from(shdr_fmt, data, shoff + i * shentsize) for i in range(shnum)]
+        sections = []
+        if raw_sections and shstrndx < len(raw_sections):
+            strtab_offset = raw_sections[shstrndx][4]
+            for name, sh_type, _, addr, offset, size, link, _, _, _ in raw_sections:
+                start = strtab_offset + name
+                end = data.find(b"\0", start)
+                section_name = data[start:end].decode("utf-8", "replace")
+                sections.append(ELF_SECTION(section_name, sh_type, addr, offset, size, link))
+    except struct.error:
+        return None
+    return ELF_IMAGE(data, endian, is_64, machine, sections, segments)
+
+
+def get_elf_build_id(elf):
+    """Returns the contents of the NT_GNU_BUILD_ID note of |elf|, looking at
+    the note sections first and at the PT_NOTE segments if the section
+    headers were stripped. Returns None if there is no build ID."""
+    notes = [(s.offset, s.size) for s in elf.sections if s.type == SHT_NOTE]
+    if not notes:
+        notes = [(s.offset, s.size) for s in elf.segments if s.type == PT_NOTE]
+    for offset, size in notes:
+        end = min(offset + size, len(elf.data))
+        while offset + 12 <= end:
+            namesz, descsz, note_type = struct.unpack_from(elf.endian + "III", elf.data, offset)
+            name_offset = offset + 12
+            desc_offset = name_offset + ((namesz + 3) & ~3)
+            if note_type == NT_GNU_BUILD_ID and elf.data[name_offset : name_offset + namesz] == b"GNU\0":
+                return bytes(elf.data[desc_offset : desc_offset + descsz])
+            offset = desc_offset + ((descsz + 3) & ~3)
+    return None
+
+
+def get_binary_info_from_elf(binary: Path, elf):
+    """Returns the BINARY_INFO of the ELF file |binary| from its build ID, or
+    None if it has none. Binaries without a build ID are identified by
+    dump_syms from a hash of their text section, which is left to it.
+
+    As in dump_syms, the module is named after its DT_SONAME if it has one,
+    and the ID is byte-swapped with htonl(), i.e. depending on the byte order
+    of the host rather than the one of the file."""
+    build_id = get_elf_build_id(elf)
+    if not build_id:
+        return None
+    try:
+        dynamic = parse_elf_dynamic(elf)
+    except struct.error:
+        dynamic = None
+    name = dynamic.soname if dynamic and dynamic.soname else binary.name
+    arch = ELF_ARCHS.get(elf.machine, "unknown")
+    module_id = format_module_id(build_id, 0, sys.byteorder == "little")
+    return BINARY_INFO("Linux", arch, module_id, name)
+
+
+def get_macho_slices(data):
+    """Returns the (offset, size) of every Mach-O image in the mapped file
+    |data|: one per slice of a universal binary, or the whole file for a thin
+    one. Returns an empty list if |data| is not a Mach-O file."""
+    magic = data[:4]
+    if magic in MACHO_MAGICS:
+        return [(0, len(data))]
+    if magic not in (FAT_MAGIC, FAT_MAGIC_64):
+        return []
+    try:
+        nfat_arch = struct.unpack_from(">I", data, 4)[0]
+        if nfat_arch > FAT_MAX_ARCHS:
+            return []
+        slices = []
+        for i in range(nfat_arch):
+            if magic == FAT_MAGIC:
+                _, _, offset, size, _ = struct.unpack_from(">iiIII", data, 8 + i * 20)
+            else:
+                _, _, offset, size, _, _ = struct.unpack_from(">iiQQII", data, 8 + i * 32)
+            slices.append((offset, size))
+    except struct.error:
+        return []
+    return slices
+
+
+def parse_macho(data, offset: int = 0):
+    """Parses the header and the load command table of the Mach-O image at
+    |offset| of the mapped file |data|. Returns a MACHO_IMAGE, or None if there
+    is no valid Mach-O image there."""
+    magic = data[offset : offset + 4]
+    if magic not in MACHO_MAGICS:
+        return None
+    endian, is_64 = MACHO_MAGICS[magic]
+    try:
+        cputype, cpusubtype, _, ncmds, _ = struct.unpack_from(endian + "iiIII", data, offset + 4)
+        command_offset = offset + (32 if is_64 else 28)
+        commands = []
+        for _ in range(ncmds):
+            cmd, cmdsize = struct.unpack_from(endian + "II", data, command_offset)
+            if cmdsize < 8:
+                return None
+            commands.append((cmd, command_offset, cmdsize))
+            command_offset += cmdsize
+    except struct.error:
+        return None
+    return MACHO_IMAGE(data, endian, cputype & 0xFFFFFFFF, cpusubtype & CPU_SUBTYPE_MASK, commands)
+
+
+def get_macho_arch(macho):
+    """Returns the architecture name dump_syms uses for |macho|."""
+    arch = MACHO_SUBTYPE_ARCHS.get((macho.cputype, macho.cpusubtype))
+    return arch or MACHO_ARCHS.get(macho.cputype, "unknown")
+
+
+def get_binary_infos_from_macho(binary: Path, data):
+    """Returns a BINARY_INFO per slice of the Mach-O file |binary|, using the
+    LC_UUID of each slice as its module ID. Returns an empty list if any slice
+    cannot be identified, leaving the whole file to dump_syms."""
+    binary_infos = []
+    for offset, _ in get_macho_slices(data):
+        macho = parse_macho(data, offset)
+        if not macho:
+            return []
+        uuid = None
+        for cmd, cmd_offset, cmdsize in macho.commands:
+            if cmd == LC_UUID and cmdsize >= 24:
+                uuid = bytes(data[cmd_offset + 8 : cmd_offset + 24])
+                break
+        if not uuid:
+            return []
+        binary_infos.append(BINARY_INFO("mac", get_macho_arch(macho), format_module_id(uuid, 0, False), binary.name))
+    return binary_infos
+
+
+def read_macho_linkage(binary: Path):
+    """Returns the MACHO_LINKAGE of the Mach-O file |binary| from its load
+    commands, read in a single pass, or None if it is not a Mach-O file. The
+    load commands of all the slices of a universal binary are merged."""
+    data = map_binary(binary)
+    if data is None:
+        return None
+    with data:
+        slices = get_macho_slices(data)
+        if not slices:
+            return None
+        dylib_id = None
+        rpaths, dylibs = [], []
+        for offset, _ in slices:
+            macho = parse_macho(data, offset)
+            if not macho:
+                return None
+            for cmd, cmd_offset, cmdsize in macho.commands:
+                if cmd not in MACHO_DYLIB_COMMANDS and cmd not in (LC_ID_DYLIB, LC_RPATH):
+                    continue
+                # dylib_command and rpath_command both start with the offset of
+                # their path, relative to the command.
+                name_offset = cmd_offset + struct.unpack_from(macho.endian + "I", data, cmd_offset + 8)[0]
+                end = data.find(b"\0", name_offset, cmd_offset + cmdsize)
+                name = data[name_offset : end if end != -1 else cmd_offset + cmdsize].decode("utf-8", "replace")
+                if cmd == LC_ID_DYLIB:
+                    dylib_id = name
+                elif cmd == LC_RPATH:
+                    if name not in rpaths:
+                        rpaths.append(name)
+                elif name not in dylibs:
+                    dylibs.append(name)
+    return MACHO_LINKAGE(dylib_id, rpaths, dylibs)
+
+
+def is_object_file(path):
+    """Returns whether |path| starts like an ELF, Mach-O (thin or universal)
+    or PE file, reading only its first bytes."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(64)
+            if header[:2] == b"MZ" and len(header) == 64:
+                f.seek(struct.unpack_from("<I", header, 0x3C)[0])
+                return f.read(4) == PE_SIGNATURE
+    except OSError:
+        return False
+    if header[:4] in (FAT_MAGIC, FAT_MAGIC_64):
+        return len(header) >= 8 and 0 < struct.unpack_from(">I", header, 4)[0] <= FAT_MAX_ARCHS
+    return header[:4] == ELF_MAGIC or header[:4] in MACHO_MAGICS
+
+
+def get_binary_infos_from_file(binary: Path):
+    """Identifies |binary| by reading its headers in-process, without running
+    dump_syms. Returns the BINARY_INFO that dump_syms would report in its
+    MODULE line for each architecture in the binary, or an empty list if the
+    binary cannot be identified this way."""
+    data = map_binary(binary)
+    if data is None:
+        return []
+    with data:
+        elf = parse_elf(data)
+        if elf:
+            binary_info = get_binary_info_from_elf(binary, elf)
+            return [binary_info] if binary_info else []
+        pe = parse_pe(data)
+        if pe:
+            binary_info = get_binary_info_from_pe(pe)
+            return [binary_info] if binary_info else []
+        return get_binary_infos_from_macho(binary, data)
+
+
+def parse_pe(data):
+    """Parses the COFF, optional and section headers of the mapped file
+    |data|. Returns a PE_IMAGE, or None if |data| is not a valid PE file."""
+    if data[:2] != b"MZ":
+        return None
+    try:
+        pe_offset = struct.unpack_from("<I", data, 0x3C)[0]
+        if data[pe_offset : pe_offset + 4] != PE_SIGNATURE:
+            return None
+        machine, nsections, _, _, _, optional_size, _ = struct.unpack_from("<HHIIIHH", data, pe_offset + 4)
+        optional_offset = pe_offset + 24
+        magic = struct.unpack_from("<H", data, optional_offset)[0]
+        if magic == PE32_MAGIC:
+            directories_offset = optional_offset + 96
+        elif magic == PE32_PLUS_MAGIC:
+            directories_offset = optional_offset + 112
+        else:
+            return None
+        ndirectories = struct.unpack_from("<I", data, directories_offset - 4)[0]
+        ndirectories = min(ndirectories, (optional_offset + optional_size - directories_offset) // 8)
+        directories = [struct.unpack_from("<II", data, directories_offset + i * 8) for i in range(ndirectories)]
+        sections = []
+        sections_offset = optional_offset + optional_size
+        for i in range(nsections):
+            name, virtual_size, rva, raw_size, offset = struct.unpack_from("<8sIIII", data, sections_offset + i * 40)
+            name = name.rstrip(b"\0").decode("utf-8", "replace")
+            sections.append(PE_SECTION(name, rva, virtual_size, offset, raw_size))
+    except struct.error:
+        return None
+    return PE_IMAGE(data, machine, directories, sections)
+
+
+def get_pe_offset(pe, rva: int):
+    """Returns the file offset of the relative virtual address |rva| of |pe|,
+    or None if no section maps it."""
+    for section in pe.sections:
+        if section.rva <= rva < section.rva + max(section.virtual_size, section.raw_size):
+            return section.offset + rva - section.rva
+    return None
+
+
+def get_binary_info_from_pe(pe):
+    """Returns the BINARY_INFO of |pe| from the GUID and age of its CodeView
+    (RSDS) debug record, named after the PDB file it points to. Returns None
+    if the binary has no such record."""
+    if len(pe.directories) <= IMAGE_DIRECTORY_ENTRY_DEBUG:
+        return None
+    rva, size = pe.directories[IMAGE_DIRECTORY_ENTRY_DEBUG]
+    offset = get_pe_offset(pe, rva)
+    if not rva or offset is None:
+        return None
+    try:
+        for entry_offset in range(offset, offset + size - 27, 28):
+            debug_type, _, _, pointer = struct.unpack_from("<IIII", pe.data, entry_offset + 12)
+            if debug_type != IMAGE_DEBUG_TYPE_CODEVIEW or pe.data[pointer : pointer + 4] != CODEVIEW_RSDS:
+                continue
+            guid = bytes(pe.data[pointer + 4 : pointer + 20])
+            age = struct.unpack_from("<I", pe.data, pointer + 20)[0]
+            end = pe.data.find(b"\0", pointer + 24)
+            pdb_path = pe.data[pointer + 24 : end].decode("utf-8", "replace")
+            pdb_name = pdb_path.replace("\\", "/").split("/")[-1]
+            arch = PE_ARCHS.get(pe.machine, "unknown")
+            return BINARY_INFO("windows", arch, format_module_id(guid, age, True), pdb_name)
+    except struct.error:
+        pass
+    return None
+
+
+def get_dump_weight(binary: Path, arch: str = None):
+    """Returns the number of bytes dump_syms is expected to process for
+    |binary|, or for its |arch| slice if it is a universal binary. DWARF is
+    what dominates the work, so the .debug_info section of ELF files is
+    counted on top of the file size."""
+    data = map_binary(binary)
+    if data is None:
+        return 0
+    with data:
+        weight = len(data)
+        elf = parse_elf(data)
+        if elf:
+            weight += sum(s.size for s in elf.sections if s.name in (".debug_info", ".zdebug_info"))
+        elif arch:
+            for offset, size in get_macho_slices(data):
+                macho = parse_macho(data, offset)
+                if macho and get_macho_arch(macho) == arch:
+                    weight = size
+    return weight
+
+
+def read_pe_imports(binary: Path):
+    """Returns the names of the DLLs imported by the PE file |binary|, from
+    its import and delay-load import tables, as `dumpbin /DEPENDENTS` lists
+    them. Returns an empty list if it is not a PE file."""
+    data = map_binary(binary)
+    if data is None:
+        return []
+    with data:
+        pe = parse_pe(data)
+        if not pe:
+            return []
+        names = []
+        try:
+            for directory, descriptor_size, name_field in PE_IMPORT_TABLES:
+                if len(pe.directories) <= directory or not pe.directories[directory][0]:
+                    continue
+                offset = get_pe_offset(pe, pe.directories[directory][0])
+                while offset is not None and any(data[offset : offset + descriptor_size]):
+                    name_offset = get_pe_offset(pe, struct.unpack_from("<I", data, offset + name_field)[0])
+                    end = -1 if name_offset is None else data.find(b"\0", name_offset)
+                    if end > name_offset:
+                        name = data[name_offset:end].decode("utf-8", "replace")
+                        if name not in names:
+                            names.append(name)
+                    offset += descriptor_size
+        except struct.error:
+            pass
+    return names
+
+
+def get_dump_jobs(binaries: list):
+    """Returns the DUMP_JOBs for |binaries|, with one job per slice of
+    universal binaries. Binaries that cannot be identified in-process get a
+    single job without BINARY_INFO."""
+    jobs = []
+    for binary in binaries:
+        binary_infos = get_binary_infos_from_file(binary)
+        if len(binary_infos) > 1:
+            for binary_info in binary_infos:
+                jobs.append(DUMP_JOB(binary, binary_info, binary_info.arch, get_dump_weight(binary, binary_info.arch)))
+        else:
+            binary_info = binary_infos[0] if binary_infos else None
+            jobs.append(DUMP_JOB(binary, binary_info, None, get_dump_weight(binary)))
+    return jobs
+
+
+def estimate_dump_durations(jobs: list, symbols_dir: Path, cache=None, history: dict = None):
+    """Returns the expected duration in seconds of each of |jobs|. Jobs whose
+    symbol file already exists cost nothing, jobs with a recorded duration in
+    the |cache| history are scaled by their change in weight, and the rest
+    are estimated from their weight and the throughput of past runs. The
+    |history| already read from the cache can be given instead."""
+    if history is None:
+        history = cache.get_runs() if cache else {}
+    throughput = DEFAULT_DUMP_THROUGHPUT
+    if history:
+        total_seconds = sum(seconds for _, seconds, _ in history.values())
+        if total_seconds > 0:
+            throughput = sum(weight for weight, _, _ in history.values()) / total_seconds
+    durations = []
+    for job in jobs:
+        past = history.get((str(job.binary), job.arch or ""))
+        if job.binary_info and get_symbol_file_path(symbols_dir, job.binary_info).exists():
+            durations.append(0.0)
+        elif past and past[0] > 0:
+            durations.append(past[1] * job.weight / past[0])
+        else:
+            durations.append(job.weight / throughput)
+    return durations
+
+
+def estimate_dump_memory(jobs: list, symbols_dir: Path, cache=None, history: dict = None):
+    """Returns the expected peak RSS in bytes of dump_syms for each of |jobs|,
+    like estimate_dump_durations() does for their durations. Jobs without a
+    measured run of their own are estimated from their weight and the largest
+    RSS per weight byte measured so far, to err on the safe side."""
+    if history is None:
+        history = cache.get_runs() if cache else {}
+    measured = [(weight, peak_rss) for weight, _, peak_rss in history.values() if weight and peak_rss]
+    rss_per_weight = DEFAULT_RSS_PER_WEIGHT
+    if measured:
+        rss_per_weight = max(peak_rss / weight for weight, peak_rss in measured)
+    estimates = []
+    for job in jobs:
+        past = history.get((str(job.binary), job.arch or ""))
+        if job.binary_info and get_symbol_file_path(symbols_dir, job.binary_info).exists():
+            estimates.append(0)
+        elif past and past[0] and past[2]:
+            estimates.append(int(past[2] * job.weight / past[0]))
+        else:
+            estimates.append(int(job.weight * rss_per_weight))
+    return estimates
+
+
+def get_available_memory():
+    """Returns the memory available for new processes in bytes, as reported
+    by MemAvailable in /proc/meminfo, or None where it is not known."""
+    try:
+        with open("/proc/meminfo", "rt") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def read_peak_rss(pid: int):
+    """Returns the peak RSS in bytes reached so far by the running process
+    |pid| (VmHWM in /proc/<pid>/status), or None where it cannot be read."""
+    try:
+        with open("/proc/%d/status" % pid, "rt") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class MemoryBudget:
+    """Admission control for dump_syms jobs: a job is admitted once its
+    estimated peak RSS fits both in what is left of the budget and in the
+    memory currently available on the system. A job is always admitted when
+    nothing else is running, so oversized jobs still run, on their own."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._condition = asyncio.Condition()
+
+    def _fits(self, amount: int):
+        if not self.in_use:
+            return True
+        if self.in_use + amount > self.limit:
+            return False
+        available = get_available_memory()
+        return available is None or amount <= available
+
+    async def acquire(self, amount: int):
+        """Waits until |amount| bytes can be admitted and reserves them."""
+        async with self._condition:
+            while not self._fits(amount):
+                # Other processes may free memory too, so poll meanwhile.
+                try:
+                    await asyncio.wait_for(self._condition.wait(), MEMORY_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            self.in_use += amount
+
+    async def release(self, amount: int):
+        """Returns |amount| bytes reserved with acquire() to the budget."""
+        async with self._condition:
+            self.in_use -= amount
+            self._condition.notify_all()
+
+
+def parse_size(size: str):
+    """Parses a size in bytes with an optional K, M, G or T suffix. Raises
+    ValueError if |size| is not a valid size."""
+    value = size.strip().upper().rstrip("B")
+    multiplier = 1
+    if value and value[-1] in SIZE_SUFFIXES:
+        multiplier = 1024 ** (SIZE_SUFFIXES.index(value[-1]) + 1)
+        value = value[:-1]
+    try:
+        value = float(value)
+    except ValueError:
+        value = None
+    if value is None or not math.isfinite(value) or value < 0:
+        raise ValueError("invalid size: %r" % size)
+    return int(value * multiplier)
+
+
+def get_critical_path(durations: list, workers: int):
+    """Returns the makespan of running |durations| largest first on |workers|
+    parallel workers, which is the critical path of a run."""
+    finish_times = [0.0] * max(1, min(workers, len(durations)))
+    for duration in sorted(durations, reverse=True):
+        heapq.heappush(finish_times, heapq.heappop(finish_times) + duration)
+    return max(finish_times)
+
+
+def get_symbol_file_path(symbols_dir: Path, binary_info):
+    """Returns the path where the symbol file described by |binary_info| is
+    stored, i.e. symbols_dir/<name>/<hash>/<name>.sym, as dump_syms -s writes
+    it and stackwalkers look it up. Only a .pdb extension is dropped from the
+    file name, so libfoo.so.1 gets libfoo.so.1.sym."""
+    output_dir = symbols_dir / binary_info.name / binary_info.hash
+    name = binary_info.name
+    if name.lower().endswith(".pdb"):
+        name = name[: -len(".pdb")]
+    return output_dir / (name + ".sym")
+
+
+async def sample_peak_rss(process, peak_rss: list):
+    """Keeps the largest peak RSS of |process| in peak_rss[0] while it runs.
+    asyncio reaps the process itself, so its rusage is not available and its
+    VmHWM is sampled instead."""
+    while process.returncode is None:
+        rss = read_peak_rss(process.pid)
+        if rss:
+            peak_rss[0] = max(peak_rss[0] or 0, rss)
+        await asyncio.sleep(RSS_SAMPLE_INTERVAL)
+
+
+async def kill_dump_syms(process):
+    """Kills the dump_syms |process| and reaps it. Reaping a killed process
+    is immediate, so it is completed even if the caller is cancelled again
+    meanwhile, and the cancellation is raised afterwards."""
+    with contextlib.suppress(ProcessLookupError):
+        if process.returncode is not None:
+            pass
+        elif hasattr(signal, "SIGKILL"):
+            # Not process.kill(): Popen polls the child before signalling it,
+            # which reaps a child that is exiting behind the back of the
+            # child watcher. Until the watcher reaps it, its pid is not reused.
+            os.kill(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    cancelled = False
+    while True:
+        try:
+            await process.wait()
+            break
+        except asyncio.CancelledError:
+            cancelled = True
+    if cancelled:
+        raise asyncio.CancelledError()
+
+
+@contextlib.asynccontextmanager
+async def dump_syms_process(dump_syms: Path, args: list, **kwargs):
+    """Starts dump_syms with |args| as an asyncio subprocess, making sure it
+    is killed if the caller leaves the context before it exits, e.g. when the
+    job is cancelled or times out."""
+    # A cancellation while the process is being created must not lose track
+    # of it, so the creation is shielded and awaited to completion.
+    start = asyncio.ensure_future(asyncio.create_subprocess_exec(dump_syms, *args, **kwargs))
+    try:
+        process = await asyncio.shield(start)
+    except asyncio.CancelledError:
+        await kill_dump_syms(await start)
+        raise
+    peak_rss = JOB_PEAK_RSS.get()
+    sampler = None
+    if peak_rss is not None and sys.platform.startswith("linux"):
+        sampler = asyncio.ensure_future(sample_peak_rss(process, peak_rss))
+    try:
+        yield process
+    finally:
+        if sampler:
+            sampler.cancel()
+        if process.returncode is None:
+            await kill_dump_syms(process)
+
+
+async def wait_dump_syms(process, dump_syms: Path, args: list):
+    """Waits for the |dump_syms| |process| started with |args| to exit,
+    raising CalledProcessError if it failed."""
+    returncode = await process.wait()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, [str(arg) for arg in (dump_syms, *args)])
+
+
+async def probe_binary_info(dump_syms: Path, binary: Path, dump_syms_args=()):
+    """Runs dump_syms on |binary| and returns the BINARY_INFO of the MODULE
+    header it prints, or None if there is none. Only the header line is read,
+    and dump_syms is killed right after it, so the memory used does not
+    depend on the size of the symbols."""
+    args = [*dump_syms_args, binary]
+    async with dump_syms_process(dump_syms, args, stdout=subprocess.PIPE) as process:
+        try:
+            header_info = await process.stdout.readline()
+        except ValueError:
+            # The first line exceeds the stream limit, so it is no header.
+            return None
+        if not header_info:
+            await wait_dump_syms(process, dump_syms, args)
+    return get_binary_info_from_header_info(header_info.decode("utf-8"))
+
+
+def try_lock_file(fd: int):
+    """Tries to take an exclusive lock on the open file |fd| without blocking,
+    with flock() or, on Windows, msvcrt.locking(). The lock is released when
+    |fd| is closed. Returns whether it was taken, or True if neither is
+    available."""
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+@contextlib.asynccontextmanager
+async def lock_symbol_file(symbols_dir: Path, binary_info):
+    """Holds the lock of the symbol file of |binary_info| in |symbols_dir|, a
+    lock file in its .locks directory shared by every process writing there,
+    so that a module is only dumped by one of them at a time. The lock is
+    polled for, so that waiting for it can be cancelled.
+    The lock file is removed on release, and the .locks directory once it is
+    empty, so that they do not pile up in the published tree. A lock taken on
+    a file that was removed meanwhile is dropped and taken again."""
+    lock_dir = symbols_dir / ".locks"
+    lock_path = lock_dir / ("%s-%s.lock" % (binary_info.name, binary_info.hash))
+    # On Windows, open lock files cannot be unlinked but are deleted when the
+    # last handle to them is closed instead.
+    flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_TEMPORARY", 0)
+    while True:
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(lock_path, flags, 0o666)
+        except FileNotFoundError:
+            # The .locks directory was removed in between.
+            continue
+        try:
+            while not try_lock_file(fd):
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+            if os.path.samestat(os.fstat(fd), os.stat(lock_path)):
+                break
+        except FileNotFoundError:
+            pass
+        except BaseException:
+            os.close(fd)
+            raise
+        os.close(fd)
+    try:
+        yield
+    finally:
+        if not hasattr(os, "O_TEMPORARY"):
+            lock_path.unlink()
+        os.close(fd)
+        try:
+            lock_dir.rmdir()
+        except OSError:
+            pass
+
+
+async def dump_symbols_staged(dump_syms: Path, binary: Path, symbols_dir: Path, binary_info, dump_syms_args=()):
+    """Runs dump_syms on |binary| with its output in a staging directory of
+    |symbols_dir|, and moves the symbol files it wrote from there to their
+    place, so that they never appear partially written. Each one is placed
+    according to its MODULE header, with a warning if it is not the one of
+    |binary_info|, as predicted before dumping.
+    Returns a (binary_info, published) tuple, binary_info being the one of
+    the symbol file dump_syms generated, if any."""
+    symbols_dir.mkdir(parents=True, exist_ok=True)
+    staging_dir = Path(tempfile.mkdtemp(prefix=".staging-", dir=symbols_dir))
+    try:
+        args = [*dump_syms_args, binary, "-s", staging_dir]
+        async with dump_syms_process(dump_syms, args) as process:
+            await wait_dump_syms(process, dump_syms, args)
+        published_info = None
+        for staging_path in sorted(staging_dir.glob("*/*/*.sym")):
+            with open(staging_path, "rb") as f:
+                header_info = f.readline().decode("utf-8", "replace")
+            symbol_info = get_binary_info_from_header_info(header_info)
+            if not symbol_info:
+                print("WARNING: dump_syms wrote %s for %s without a MODULE header." % (staging_path.name, binary))
+                continue
+            if symbol_info != binary_info:
+                print(
+                    "WARNING: dump_syms identified %s as %s %s instead of %s %s."
+                    % (binary, symbol_info.name, symbol_info.hash, binary_info.name, binary_info.hash)
+                )
+            output_path = get_symbol_file_path(symbols_dir, symbol_info)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staging_path, output_path)
+            if not published_info or symbol_info == binary_info:
+                published_info = symbol_info
+        if not published_info:
+            print("WARNING: dump_syms wrote no symbol file for %s." % binary)
+            return binary_info, False
+        return published_info, True
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+async def dump_symbols_single_pass(dump_syms: Path, binary: Path, symbols_dir: Path, dump_syms_args=()):
+    """Runs dump_syms once on |binary|, streaming its output to a staging file
+    in |symbols_dir|. The MODULE header on the first line tells where the
+    symbol file belongs, and the staging file is then moved there. If a
+    symbol file already exists at that location, dump_syms is stopped and the
+    staging file dropped. If another process is generating it, dump_syms is
+    paused until it is done, see lock_symbol_file().
+    Returns a (binary_info, published) tuple, binary_info being None if the
+    output has no valid header."""
+    symbols_dir.mkdir(parents=True, exist_ok=True)
+    fd, staging_path = tempfile.mkstemp(prefix=".", suffix=".sym.tmp", dir=symbols_dir)
+    staging_path = Path(staging_path)
+    args = [*dump_syms_args, binary]
+    try:
+        async with dump_syms_process(dump_syms, args, stdout=subprocess.PIPE) as process:
+            with os.fdopen(fd, "wb") as f:
+                try:
+                    header_info = await process.stdout.readline()
+                except ValueError:
+                    # The first line exceeds the stream limit, so it is no header.
+                    header_info = b""
+                binary_info = get_binary_info_from_header_info(header_info.decode("utf-8", "replace"))
+                if not binary_info:
+                    # A missing header is most likely a failure of dump_syms,
+                    # which is then reported once it exits.
+                    while await process.stdout.read(DUMP_SYMS_READ_SIZE):
+                        pass
+                    await wait_dump_syms(process, dump_syms, args)
+                    return None, False
+                output_path = get_symbol_file_path(symbols_dir, binary_info)
+                if output_path.exists():
+                    return binary_info, False
+                async with lock_symbol_file(symbols_dir, binary_info):
+                    if output_path.exists():
+                        return binary_info, False
+                    f.write(header_info)
+                    while True:
+                        chunk = await process.stdout.read(DUMP_SYMS_READ_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                    f.close()
+                    await wait_dump_syms(process, dump_syms, args)
+                    output_path.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(staging_path, output_path)
+        return binary_info, True
+    finally:
+        staging_path.unlink(missing_ok=True)
+
+
+def reflink_file(src_fd: int, dst_fd: int):
+    """Makes the file |dst_fd| share the data of |src_fd| copy-on-write.
+    Returns whether the filesystem supports it."""
+    if not fcntl or not sys.platform.startswith("linux"):
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError:
+        return False
+    return True
+
+
+def copy_file_range(src_fd: int, dst_fd: int):
+    """Copies the contents of the file |src_fd| to the empty file |dst_fd|
+    within the kernel, where copy_file_range() is available. Returns whether
+    it succeeded, leaving |dst_fd| empty otherwise."""
+    if not hasattr(os, "copy_file_range"):
+        return False
+    try:
+        while os.copy_file_range(src_fd, dst_fd, COPY_FILE_RANGE_SIZE):
+            pass
+    except OSError:
+        os.lseek(src_fd, 0, os.SEEK_SET)
+        os.lseek(dst_fd, 0, os.SEEK_SET)
+        os.ftruncate(dst_fd, 0)
+        return False
+    return True
+
+
+def publish_file(src: Path, dst: Path):
+    """Atomically places the contents of |src| at |dst|, replacing any file
+    there, as cheaply as the filesystems allow: a reflink, then a hardlink,
+    as symbol files are never modified in place, then an in-kernel copy with
+    copy_file_range(), and a plain copy otherwise, which shutil still does
+    with sendfile() on Linux."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    fd, staging_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=dst.parent)
+    staging_path = Path(staging_path)
+    try:
+        with open(src, "rb") as src_file, os.fdopen(fd, "wb") as staging_file:
+            copied = reflink_file(src_file.fileno(), staging_file.fileno())
+        linked = False
+        if not copied:
+            try:
+                staging_path.unlink()
+                os.link(src, staging_path)
+                linked = True
+            except OSError:
+                pass
+        if not linked and not copied:
+            with open(src, "rb") as src_file, open(staging_path, "wb") as staging_file:
+                copied = copy_file_range(src_file.fileno(), staging_file.fileno())
+            if not copied:
+                shutil.copyfile(src, staging_path)
+        if not linked:
+            shutil.copymode(src, staging_path)
+        os.replace(staging_path, dst)
+    finally:
+        staging_path.unlink(missing_ok=True)
+
+
+def get_file_key(binary: Path):
+    """Returns the (device, inode, size, mtime_ns) tuple that identifies the
+    current contents of |binary| without reading it."""
+    st = os.stat(binary)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class SymbolsCache:
+    """Persistent cache stored in the symbols directory, mapping the file key
+    of a binary (see get_file_key()) to the BINARY_INFO of each of its symbol
+    files. Unchanged binaries are then skipped without identifying them.
+    It also holds the dump_syms runs used to estimate the next ones, the
+    manifest of the dependency closure of each root binary, and the hashes of
+    the binaries looked up in a RemoteSymbolsCache."""
+
+    FILENAME = ".generate_symbols_cache.sqlite"
+    # Bumped whenever the tables or the identification of binaries change;
+    # older caches are then discarded.
+    SCHEMA_VERSION = 7
+
+    def __init__(self, symbols_dir: Path):
+        self.symbols_dir = symbols_dir
+        symbols_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(symbols_dir / self.FILENAME), timeout=60, check_same_thread=False)
+        with self._db:
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                tables = self._db.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+                for (table,) in tables:
+                    self._db.execute("DROP TABLE %s" % table)
+                self._db.execute("PRAGMA user_version = %d" % self.SCHEMA_VERSION)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS symbols ("
+                "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, "
+                "platform TEXT, arch TEXT, hash TEXT, name TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS symbols_file ON symbols (dev, ino)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "path TEXT, arch TEXT, weight INTEGER, seconds REAL, peak_rss INTEGER, "
+                "PRIMARY KEY (path, arch))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS closures ("
+                "root TEXT, platform TEXT, environment TEXT, path TEXT, "
+                "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, linkage TEXT, deps TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS closures_root ON closures (root, platform)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, hash TEXT, "
+                "PRIMARY KEY (dev, ino))"
+            )
+
+    def lookup(self, file_key):
+        """Returns the BINARY_INFOs recorded for |file_key|, or None if there
+        are none. Entries whose symbol files disappeared are evicted."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT platform, arch, hash, name FROM symbols "
+                "WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+                file_key,
+            ).fetchall()
+            binary_infos = [BINARY_INFO(*row) for row in rows]
+            if not binary_infos:
+                return None
+            for binary_info in binary_infos:
+                if not get_symbol_file_path(self.symbols_dir, binary_info).exists():
+                    with self._db:
+                        self._db.execute("DELETE FROM symbols WHERE dev = ? AND ino = ?", file_key[:2])
+                    return None
+            return binary_infos
+
+    def store(self, file_key, binary_infos: list):
+        """Records |binary_infos| as the symbol files of |file_key|, replacing
+        anything recorded for a previous version of the same file."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM symbols WHERE dev = ? AND ino = ?", file_key[:2])
+            self._db.executemany(
+                "INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*file_key, *binary_info) for binary_info in binary_infos],
+            )
+
+    def get_runs(self):
+        """Returns the last recorded dump_syms run of each binary, as a dict
+        mapping (path, arch) to (weight, seconds, peak_rss). peak_rss is None
+        if it could not be measured."""
+        with self._lock:
+            rows = self._db.execute("SELECT path, arch, weight, seconds, peak_rss FROM runs").fetchall()
+        return {(row[0], row[1]): row[2:] for row in rows}
+
+    def store_run(self, job, seconds: float, peak_rss: int = None):
+        """Records that dump_syms took |seconds| and peaked at |peak_rss|
+        bytes of resident memory for the DUMP_JOB |job|."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?)",
+                (str(job.binary), job.arch or "", job.weight, seconds, peak_rss),
+            )
+
+    def lookup_closure(self, root: Path, platform: str, environment: str):
+        """Returns the manifest of the dependency closure of |root| recorded
+        for |platform| and |environment| (see get_dependency_environment()),
+        as a dict mapping the path of each node to its file key, linkage and
+        list of direct dependencies. Returns None if there is none."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path, dev, ino, size, mtime_ns, linkage, deps FROM closures "
+                "WHERE root = ? AND platform = ? AND environment = ?",
+                (str(root), platform, environment),
+            ).fetchall()
+        return {row[0]: (row[1:5], row[5], row[6].split("\n") if row[6] else []) for row in rows} or None
+
+    def store_closure(self, root: Path, platform: str, environment: str, nodes: list):
+        """Records the manifest of the dependency closure of |root|, from a
+        list of (path, file key, linkage, dependencies) tuples."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM closures WHERE root = ? AND platform = ?", (str(root), platform))
+            self._db.executemany(
+                "INSERT INTO closures VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (str(root), platform, environment, path, *file_key, linkage, "\n".join(deps))
+                    for path, file_key, linkage, deps in nodes
+                ],
+            )
+
+    def lookup_hash(self, file_key):
+        """Returns the hash_file() digest recorded for |file_key|, or None if
+        there is none for the current HASH_ALGORITHM."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT hash FROM hashes WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+                file_key,
+            ).fetchone()
+        if not row or not row[0].startswith(HASH_ALGORITHM + ":"):
+            return None
+        return row[0]
+
+    def store_hash(self, file_key, digest: str):
+        """Records |digest| as the hash_file() digest of |file_key|, replacing
+        the one of a previous version of the same file."""
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)", (*file_key, digest))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class SharedSymbolsCache:
+    """Symbol files shared by every build on the machine, such as those of
+    system libraries, stored under |directory| with the layout of a symbols
+    directory, so that they are keyed by module ID. Files are hardlinked in
+    and out of it when possible, and the least recently used ones are evicted
+    once it holds more than |max_size| bytes, see trim()."""
+
+    def __init__(self, directory: Path, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def fetch(self, binary_info, output_path: Path):
+        """Places the cached symbol file of |binary_info| at |output_path|.
+        Returns whether there was one."""
+        cached_path = get_symbol_file_path(self.directory, binary_info)
+        try:
+            # Bump the access time even on relatime or noatime mounts.
+            os.utime(cached_path)
+            publish_file(cached_path, output_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def store(self, binary_info, symbol_file: Path):
+        """Adds |symbol_file|, the symbol file of |binary_info|, to the cache."""
+        cached_path = get_symbol_file_path(self.directory, binary_info)
+        if cached_path.exists() or os.path.getsize(symbol_file) > self.max_size:
+            return
+        publish_file(symbol_file, cached_path)
+
+    def trim(self):
+        """Evicts the least recently accessed symbol files until the cache
+        holds at most max_size bytes."""
+        files = []
+        directories = [self.directory]
+        while directories:
+            try:
+                with os.scandir(directories.pop()) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif entry.name.endswith(".sym"):
+                        st = entry.stat(follow_symlinks=False)
+                        files.append((st.st_atime_ns, st.st_size, entry.path))
+                except OSError:
+                    continue
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, path in sorted(files):
+            if size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+
+
+def hash_file(path: Path):
+    """Returns the digest of the contents of |path|, prefixed with the name of
+    its algorithm: XXH3-128 when the xxhash module is available, BLAKE2b
+    otherwise. The file is mapped and hashed in a single call, during which
+    the GIL is released, so threads can hash several files in parallel."""
+    digest = xxhash.xxh3_128() if xxhash else hashlib.blake2b()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    data.madvise(mmap.MADV_SEQUENTIAL)
+                digest.update(data)
+    return "%s:%s" % (HASH_ALGORITHM, digest.hexdigest())
+
+
+class FileHasher:
+    """Hashes files with hash_file() on a pool of |threads| threads, so that
+    hashing overlaps with the rest of the work. Hashes are memoized by file
+    key (see get_file_key()), and recorded in the SymbolsCache |cache| if
+    given, so each version of a file is only read once across runs."""
+
+    def __init__(self, threads: int = HASH_THREADS, cache=None):
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, threads))
+        self._lock = threading.Lock()
+        self._hashes = {}
+        self._cache = cache
+
+    def _hash(self, path: Path, file_key):
+        digest = hash_file(path)
+        # Only record the hash if the file did not change while it was read.
+        if self._cache and get_file_key(path) == file_key:
+            # The cache may be closed by then, if the run is over.
+            with contextlib.suppress(sqlite3.Error):
+                self._cache.store_hash(file_key, digest)
+        return digest
+
+    def submit(self, path: Path):
+        """Returns a concurrent.futures.Future of the hash of |path|."""
+        file_key = get_file_key(path)
+        with self._lock:
+            future = self._hashes.get(file_key)
+            if future is None:
+                digest = self._cache.lookup_hash(file_key) if self._cache else None
+                if digest:
+                    future = concurrent.futures.Future()
+                    future.set_result(digest)
+                else:
+                    future = self._pool.submit(self._hash, path, file_key)
+                self._hashes[file_key] = future
+        return future
+
+    def close(self):
+        """Drops the hashes that did not start yet."""
+        with self._lock:
+            for future in self._hashes.values():
+                future.cancel()
+        self._pool.shutdown(wait=False)
+
+
+class FileSymbolsBackend:
+    """Storage of a RemoteSymbolsCache in |directory|, which can be shared
+    over a network filesystem."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def _path(self, key: str):
+        return self.directory / key[:2] / key
+
+    def get(self, key: str, f):
+        """Writes the entry for |key| to the file |f|. Returns whether there
+        was one."""
+        try:
+            with open(self._path(key), "rb") as entry:
+                shutil.copyfileobj(entry, f, REMOTE_CACHE_READ_SIZE)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key: str, symbol_file: Path):
+        """Stores |symbol_file| as the entry for |key|."""
+        publish_file(symbol_file, self._path(key))
+
+
+class HttpSymbolsBackend:
+    """Storage of a RemoteSymbolsCache on an HTTP server, with an entry at
+    |url|/<key> for each key: GET fetches it, answering 404 if there is none,
+    and PUT stores it. Connections are kept alive and reused by every
+    thread, so a lookup costs a single round trip."""
+
+    def __init__(self, url: str, timeout: float = REMOTE_CACHE_TIMEOUT):
+        url = urllib.parse.urlsplit(url)
+        if url.scheme == "https":
+            self._connection_class = http.client.HTTPSConnection
+        else:
+            self._connection_class = http.client.HTTPConnection
+        self._netloc = url.netloc
+        self._path = url.path.rstrip("/")
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _request(self, method: str, key: str, body=None, headers=None):
+        """Sends a request for |key| on a pooled connection and returns the
+        connection and its response, which must be read completely before
+        returning the connection with _release(). A connection found closed
+        by the server is replaced once."""
+        for attempt in range(2):
+            with self._lock:
+                connection = self._connections.pop() if self._connections else None
+            reused = connection is not None
+            if not connection:
+                connection = self._connection_class(self._netloc, timeout=self._timeout)
+            try:
+                if body is not None:
+                    body.seek(0)
+                connection.request(method, "%s/%s" % (self._path, key), body=body, headers=headers or {})
+                return connection, connection.getresponse()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                if not reused or attempt:
+                    raise
+
+    def _release(self, connection, response):
+        if response.will_close:
+            connection.close()
+        else:
+            with self._lock:
+                self._connections.append(connection)
+
+    def _check_status(self, method: str, key: str, response):
+        """Raises an http.client.HTTPException if |response| is an error."""
+        if response.status >= 300:
+            raise http.client.HTTPException(
+                "%s %s/%s failed: %d %s" % (method, self._path, key, response.status, response.reason)
+            )
+
+    def get(self, key: str, f):
+        """Writes the entry for |key| to the file |f|. Returns whether there
+        was one."""
+        connection, response = self._request("GET", key)
+        try:
+            found = response.status == 200
+            if found:
+                shutil.copyfileobj(response, f, REMOTE_CACHE_READ_SIZE)
+            else:
+                response.read()
+        except BaseException:
+            connection.close()
+            raise
+        self._release(connection, response)
+        if response.status != 404:
+            self._check_status("GET", key, response)
+        return found
+
+    def put(self, key: str, symbol_file: Path):
+        """Stores |symbol_file| as the entry for |key|."""
+        with open(symbol_file, "rb") as body:
+            headers = {"Content-Length": str(os.fstat(body.fileno()).st_size)}
+            connection, response = self._request("PUT", key, body, headers)
+            try:
+                response.read()
+            except BaseException:
+                connection.close()
+                raise
+        self._release(connection, response)
+        self._check_status("PUT", key, response)
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+
+class RemoteSymbolsCache:
+    """Cache of symbol files shared by several machines, such as CI agents,
+    in a FileSymbolsBackend or HttpSymbolsBackend. Entries are addressed by
+    the contents of the binary, of the dump_syms executable and its
+    arguments, so they are valid wherever the same binary is built. The
+    binaries are hashed by a FileHasher of |hash_threads| threads, ahead of
+    their lookup when prefetch() is called, and their hashes are kept in the
+    SymbolsCache |cache| if given. Errors of the backend, and files that
+    cannot be hashed, are reported and then treated as misses."""
+
+    def __init__(self, backend, dump_syms: Path, hash_threads: int = HASH_THREADS, cache=None):
+        self.backend = backend
+        self._hasher = FileHasher(hash_threads, cache)
+        # dump_syms may be a bare name, looked up in PATH when it is run.
+        self._dump_syms = dump_syms and Path(shutil.which(str(dump_syms)) or dump_syms)
+
+    def prefetch(self, binary: Path):
+        """Starts hashing |binary| in the background."""
+        try:
+            self._hasher.submit(binary)
+        except OSError:
+            pass
+
+    async def get_key(self, binary: Path, dump_syms_args=()):
+        """Returns the key of the symbol file dump_syms would generate for
+        |binary| with |dump_syms_args|, or None if it cannot be computed."""
+        digest = hashlib.blake2b(digest_size=32)
+        try:
+            digest.update((await asyncio.wrap_future(self._hasher.submit(binary))).encode())
+            if self._dump_syms:
+                digest.update((await asyncio.wrap_future(self._hasher.submit(self._dump_syms))).encode())
+        except OSError as e:
+            print("Could not look %s up in the remote symbols cache: %s" % (binary, e))
+            return None
+        for arg in dump_syms_args:
+            digest.update(b"\0" + str(arg).encode())
+        return digest.hexdigest()
+
+    def fetch(self, key: str, symbols_dir: Path, binary_info=None):
+        """Places the symbol file stored for |key| in |symbols_dir|, provided
+        it matches |binary_info| if given. Returns its BINARY_INFO, or None if
+        there is none."""
+        symbols_dir.mkdir(parents=True, exist_ok=True)
+        fd, staging_path = tempfile.mkstemp(prefix=".", suffix=".sym.tmp", dir=symbols_dir)
+        staging_path = Path(staging_path)
+        try:
+            with os.fdopen(fd, "w+b") as f:
+                if not self.backend.get(key, f):
+                    return None
+                f.seek(0)
+                header_info = f.readline().decode("utf-8", "replace")
+            fetched_info = get_binary_info_from_header_info(header_info)
+            if not fetched_info or (binary_info and fetched_info != binary_info):
+                return None
+            output_path = get_symbol_file_path(symbols_dir, fetched_info)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staging_path, output_path)
+            return fetched_info
+        except (OSError, http.client.HTTPException) as e:
+            print("Could not fetch %s from the remote symbols cache: %s" % (key, e))
+            return None
+        finally:
+            staging_path.unlink(missing_ok=True)
+
+    def store(self, key: str, symbol_file: Path):
+        """Stores |symbol_file| as the entry for |key|."""
+        try:
+            self.backend.put(key, symbol_file)
+        except (OSError, http.client.HTTPException) as e:
+            print("Could not store %s in the remote symbols cache: %s" % (symbol_file, e))
+
+    def close(self):
+        self._hasher.close()
+        if hasattr(self.backend, "close"):
+            self.backend.close()
+
+
+class SidecarIndex:
+    """Index of the symbol files shipped next to binaries, named after them as
+    <binary>.breakpad*. Each directory is listed once, however many binaries
+    it holds, and the MODULE line of each symbol file is only read the first
+    time it is needed. It is shared by the workers of a run, which all use it
+    from the event loop."""
+
+    SUFFIX = ".breakpad"
+
+    def __init__(self):
+        self._directories = {}
+        self._binary_infos = {}
+
+    def _list_directory(self, directory: str):
+        """Returns a dict mapping the name of each binary of |directory| with
+        sidecar files to their sorted paths."""
+        sidecars = collections.defaultdict(list)
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # Any prefix ending before ".breakpad" may be the binary.
+                    i = entry.name.find(self.SUFFIX)
+                    while i > 0:
+                        sidecars[entry.name[:i]].append(entry.path)
+                        i = entry.name.find(self.SUFFIX, i + 1)
+        except OSError:
+            pass
+        for paths in sidecars.values():
+            paths.sort()
+        return sidecars
+
+    def find(self, binary: Path):
+        """Returns the paths of the sidecar symbol files of |binary|."""
+        directory, name = os.path.split(str(binary))
+        sidecars = self._directories.get(directory)
+        if sidecars is None:
+            sidecars = self._directories[directory] = self._list_directory(directory)
+        return sidecars.get(name, [])
+
+    def get_binary_info(self, sidecar: str):
+        """Returns the BINARY_INFO from the MODULE line of |sidecar|."""
+        if sidecar not in self._binary_infos:
+            with open(sidecar, "rt") as f:
+                self._binary_infos[sidecar] = get_binary_info_from_header_info(f.readline())
+        return self._binary_infos[sidecar]
+
+
 def create_symbol_dir(output_dir: Path, platform: str, relative_hash_dir):
     """Create the directory to store breakpad symbols in. On Android/Linux, we
     also create a symlink in case the hash in the binary is missing."""
@@ -244,6 +2372,103 @@ def create_symbol_dir(output_dir: Path, platform: str, relative_hash_dir):
             pass
 
 
+def get_trash_dirs(symbols_dir: Path):
+    """Returns the trash directories of |symbols_dir| left to delete, see
+    move_to_trash()."""
+    prefix = ".%s.trash-" % symbols_dir.name
+    try:
+        with os.scandir(symbols_dir.parent) as entries:
+            return [Path(e.path) for e in entries if e.name.startswith(prefix) and e.is_dir(follow_symlinks=False)]
+    except OSError:
+        return []
+
+
+def move_to_trash(symbols_dir: Path):
+    """Empties |symbols_dir| at once, by renaming it into a trash directory
+    next to it, for remove_trash() to delete. Returns whether there was
+    anything to move."""
+    if not symbols_dir.exists():
+        return False
+    trash_dir = tempfile.mkdtemp(prefix=".%s.trash-" % symbols_dir.name, dir=symbols_dir.parent)
+    os.rename(symbols_dir, os.path.join(trash_dir, symbols_dir.name))
+    return True
+
+
+def remove_trash(symbols_dir: Path, jobs: int = CONCURRENT_TASKS):
+    """Deletes the trash directories of |symbols_dir|, including those left by
+    interrupted runs. The directories of the modules are deleted in parallel
+    by up to |jobs| threads. Trash directories that another process is
+    already deleting are left to it."""
+    trash_dirs = []
+    fds = []
+
+    def _Remove(path, is_dir):
+        if is_dir:
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+
+    try:
+        for trash_dir in get_trash_dirs(symbols_dir):
+            try:
+                fd = os.open(trash_dir, os.O_RDONLY)
+            except OSError:
+                # Directories cannot be opened, let alone locked, on Windows.
+                trash_dirs.append(trash_dir)
+                continue
+            fds.append(fd)
+            if try_lock_file(fd):
+                trash_dirs.append(trash_dir)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            for trash_dir in trash_dirs:
+                with contextlib.suppress(OSError), os.scandir(trash_dir) as entries:
+                    for entry in entries:
+                        if not entry.is_dir(follow_symlinks=False):
+                            pool.submit(_Remove, entry.path, False)
+                            continue
+                        with contextlib.suppress(OSError), os.scandir(entry.path) as module_entries:
+                            for module_entry in module_entries:
+                                pool.submit(_Remove, module_entry.path, module_entry.is_dir(follow_symlinks=False))
+        for trash_dir in trash_dirs:
+            shutil.rmtree(trash_dir, ignore_errors=True)
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def start_removing_trash(symbols_dir: Path, jobs: int = CONCURRENT_TASKS):
+    """Runs remove_trash() in a detached process, if there is any trash, so
+    that the deletion goes on after this process exits. Whatever an
+    interrupted deletion leaves is deleted by the next run."""
+    if not get_trash_dirs(symbols_dir):
+        return
+    if sys.platform == "win32":
+        kwargs = {"creationflags": subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+    else:
+        kwargs = {"start_new_session": True}
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--remove-trash", str(symbols_dir), "--jobs", str(jobs)],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        **kwargs,
+    )
+
+
+def use_pidfd_child_watcher():
+    """Makes asyncio wait for subprocesses with pidfds where it supports them
+    but does not do it by default (Python < 3.12), instead of spending one
+    thread per running child."""
+    if sys.version_info >= (3, 12) or not hasattr(asyncio, "PidfdChildWatcher"):
+        return
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except (AttributeError, OSError):
+        return
+    asyncio.set_child_watcher(asyncio.PidfdChildWatcher())
+
+
 def generate_symbols(
     symbols_dir: Path,
     platform: str,
@@ -251,81 +2476,358 @@ def generate_symbols(
     jobs: int,
     verbose: bool,
     binaries: list,
+    single_pass: bool = False,
+    use_cache: bool = True,
+    timeout: float = None,
+    max_memory: int = None,
+    binary_stream=None,
+    shared_cache=None,
+    shared_binaries=(),
+    remote_cache=None,
 ):
-    """Dumps the symbols of binary and places them in the given directory."""
-    q = queue.Queue()
+    """Dumps the symbols of binary and places them in the given directory.
+    With |single_pass|, dump_syms runs once per binary and its output is
+    published directly instead of probing the header first. With |use_cache|,
+    binaries recorded in the SymbolsCache of the directory are skipped.
+    Jobs are run longest first, as estimated by estimate_dump_durations(), by
+    up to |jobs| concurrent dump_syms processes. With |max_memory|, jobs only
+    start once their estimated peak RSS fits in that many bytes and in the
+    available memory, see MemoryBudget. A job taking longer than |timeout|
+    seconds, or the first failure, stops the whole run. |binary_stream| is an
+    optional iterable of more binaries, such as scan_binaries(), consumed by
+    a thread while the first jobs already run. The symbol files of
+    |shared_binaries| are taken from and added to the SharedSymbolsCache
+    |shared_cache|, if given, and the symbol files of every binary are looked
+    up in the RemoteSymbolsCache |remote_cache| before running dump_syms."""
     exceptions = []
-    print_lock = threading.Lock()
-    exceptions_lock = threading.Lock()
+    results = collections.defaultdict(list)
+    durations = []
+    file_keys = {}
+    realpaths = set()
+    sidecars = SidecarIndex()
+    dump_jobs = []
+    estimates = []
+    memory_estimates = []
 
-    def _Worker():
+    async def _DumpSymbols(binary, binary_info, arch, weight):
+        """Dumps the symbols of a DUMP_JOB. Returns its BINARY_INFO and
+        whether dump_syms had to generate the symbol file."""
+        should_dump_syms = True
+        reason = "no reason"
+        dump_syms_args = ["-a", arch] if arch else []
+        label = "%s (%s)" % (binary, arch) if arch else binary
+        loop = asyncio.get_running_loop()
+        run_once = True
+        while run_once:
+            run_once = False
+            if not dump_syms:
+                should_dump_syms = False
+                reason = "Could not locate dump_syms executable."
+                break
+            if not binary_info:
+                # Sidecar symbol files need the header before dumping, so only
+                # binaries without them can skip the probe.
+                if single_pass and not sidecars.find(binary):
+                    break
+                binary_info = await probe_binary_info(dump_syms, binary, dump_syms_args)
+            if not binary_info:
+                should_dump_syms = False
+                reason = "Could not obtain binary information."
+                break
+            # See if the output file already exists.
+            output_path = get_symbol_file_path(symbols_dir, binary_info)
+            output_dir = output_path.parent
+            if output_path.exists():
+                should_dump_syms = False
+                reason = "Symbol file already found."
+                break
+            # See if there is a symbol file already found next to the binary
+            for potential_symbol_file in sidecars.find(binary):
+                symbol_info = sidecars.get_binary_info(potential_symbol_file)
+                if symbol_info == binary_info:
+                    create_symbol_dir(output_dir, platform, binary_info.hash)
+                    await loop.run_in_executor(None, publish_file, Path(potential_symbol_file), output_path)
+                    should_dump_syms = False
+                    reason = "Found local symbol file."
+                    break
+            if not should_dump_syms:
+                break
+            if shared_cache and binary in shared_binaries:
+                create_symbol_dir(output_dir, platform, binary_info.hash)
+                if await loop.run_in_executor(None, shared_cache.fetch, binary_info, output_path):
+                    should_dump_syms = False
+                    reason = "Found in the shared symbols cache."
+        remote_key = None
+        if should_dump_syms and remote_cache:
+            remote_key = await remote_cache.get_key(binary, dump_syms_args)
+            fetched_info = None
+            if remote_key:
+                fetched_info = await loop.run_in_executor(
+                    None, remote_cache.fetch, remote_key, symbols_dir, binary_info
+                )
+            if fetched_info:
+                binary_info = fetched_info
+                create_symbol_dir(get_symbol_file_path(symbols_dir, binary_info).parent, platform, binary_info.hash)
+                should_dump_syms = False
+                reason = "Found in the remote symbols cache."
+        if not should_dump_syms:
+            if verbose:
+                print("Skipping %s (%s)" % (label, reason))
+            return binary_info, False
+        if binary_info is None:
+            if verbose:
+                print("Generating symbols for %s" % label)
+            binary_info, published = await dump_symbols_single_pass(dump_syms, binary, symbols_dir, dump_syms_args)
+            if verbose and not published:
+                reason = "Symbol file already found."
+                if not binary_info:
+                    reason = "Could not obtain binary information."
+                print("Discarded symbols for %s (%s)" % (label, reason))
+        else:
+            # Another process may be generating the same symbol file, in which
+            # case its result is used once it is done.
+            async with lock_symbol_file(symbols_dir, binary_info):
+                if get_symbol_file_path(symbols_dir, binary_info).exists():
+                    if verbose:
+                        print("Skipping %s (Symbol file generated by another process.)" % label)
+                    return binary_info, False
+                if verbose:
+                    print("Generating symbols for %s" % label)
+                binary_info, published = await dump_symbols_staged(
+                    dump_syms, binary, symbols_dir, binary_info, dump_syms_args
+                )
+        if published:
+            symbol_file = get_symbol_file_path(symbols_dir, binary_info)
+            if shared_cache and binary in shared_binaries:
+                await loop.run_in_executor(None, shared_cache.store, binary_info, symbol_file)
+            if remote_key:
+                await loop.run_in_executor(None, remote_cache.store, remote_key, symbol_file)
+        return binary_info, published
+
+    async def _Worker(q, budget):
         while True:
+            _, index, job = await q.get()
+            if job is None:
+                return
+            peak_rss = [None]
+            JOB_PEAK_RSS.set(peak_rss)
             try:
-                should_dump_syms = True
-                reason = "no reason"
-                binary = q.get()
-                run_once = True
-                while run_once:
-                    run_once = False
-                    if not dump_syms:
-                        should_dump_syms = False
-                        reason = "Could not locate dump_syms executable."
-                        break
-                    dump_syms_output = subprocess.check_output([dump_syms, binary]).decode("utf-8")
-                    header_info = dump_syms_output.splitlines()[0]
-                    binary_info = get_binary_info_from_header_info(header_info)
-                    if not binary_info:
-                        should_dump_syms = False
-                        reason = "Could not obtain binary information."
-                        break
-                    # See if the output file already exists.
-                    output_dir = symbols_dir / binary_info.name / binary_info.hash
-                    output_path = output_dir / Path(binary_info.name).with_suffix(".sym")
-                    if output_path.exists():
-                        should_dump_syms = False
-                        reason = "Symbol file already found."
-                        break
-                    # See if there is a symbol file already found next to the binary
-                    potential_symbol_files = glob.glob("%s.breakpad*" % binary)
-                    for potential_symbol_file in potential_symbol_files:
-                        with open(potential_symbol_file, "rt") as f:
-                            symbol_info = get_binary_info_from_header_info(f.readline())
-                        if symbol_info == binary_info:
-                            create_symbol_dir(output_dir, platform, binary_info.hash)
-                            shutil.copyfile(potential_symbol_file, output_path)
-                            should_dump_syms = False
-                            reason = "Found local symbol file."
-                            break
-                if not should_dump_syms:
-                    if verbose:
-                        with print_lock:
-                            print("Skipping %s (%s)" % (binary, reason))
+                if budget:
+                    await budget.acquire(memory_estimates[index])
+                try:
+                    start_time = time.monotonic()
+                    binary_info, dumped = await asyncio.wait_for(_DumpSymbols(*job), timeout)
+                    duration = time.monotonic() - start_time
+                finally:
+                    if budget:
+                        await budget.release(memory_estimates[index])
+            except asyncio.TimeoutError:
+                exceptions.append("Timed out after %s seconds generating symbols for %s" % (timeout, job.binary))
+                raise
+            except Exception:
+                exceptions.append(traceback.format_exc())
+                raise
+            durations.append((duration, job))
+            if binary_info and get_symbol_file_path(symbols_dir, binary_info).exists():
+                results[job.binary].append(binary_info)
+            if cache and dumped:
+                cache.store_run(job, duration, peak_rss[0])
+
+    def _GetDumpJobs(binaries, history, skip_missing=False):
+        """Returns the DUMP_JOBs of the |binaries| not seen yet nor recorded
+        in the cache, with their estimated durations and memory use."""
+        new_binaries = []
+        for binary in binaries:
+            realpath = os.path.realpath(binary)
+            if realpath in realpaths:
+                continue
+            realpaths.add(realpath)
+            try:
+                file_key = get_file_key(binary)
+            except FileNotFoundError:
+                if skip_missing:
                     continue
+                raise
+            if cache and cache.lookup(file_key):
                 if verbose:
-                    with print_lock:
-                        print("Generating symbols for %s" % binary)
-                subprocess.check_call([dump_syms, binary, "-s", symbols_dir])
-            except Exception as e:
-                with exceptions_lock:
-                    exceptions.append(traceback.format_exc())
+                    print("Skipping %s (Cached symbol file found.)" % binary)
+                continue
+            file_keys[binary] = file_key
+            new_binaries.append(binary)
+        new_jobs = get_dump_jobs(new_binaries)
+        return (
+            new_jobs,
+            estimate_dump_durations(new_jobs, symbols_dir, history=history),
+            estimate_dump_memory(new_jobs, symbols_dir, history=history),
+        )
+
+    def _Enqueue(q, new_jobs, new_estimates, new_memory_estimates):
+        for estimate, job in zip(new_estimates, new_jobs):
+            q.put_nowait((-estimate, len(dump_jobs), job))
+            dump_jobs.append(job)
+        if remote_cache:
+            # Hash the binaries in the order they will run, while dump_syms
+            # works on the first ones. Jobs estimated to cost nothing already
+            # have their symbol file, so they are never looked up.
+            for estimate, job in sorted(zip(new_estimates, new_jobs), key=lambda e: -e[0]):
+                if estimate > 0:
+                    remote_cache.prefetch(job.binary)
+        estimates.extend(new_estimates)
+        memory_estimates.extend(new_memory_estimates)
+
+    async def _Stream(q, history):
+        """Enqueues the jobs of |binary_stream| as a thread finds them, then
+        the sentinels."""
+        loop = asyncio.get_running_loop()
+        found = asyncio.Queue()
+        stop = threading.Event()
+
+        def _Scan():
+            try:
+                for binary in binary_stream:
+                    if stop.is_set():
+                        return
+                    batch = _GetDumpJobs([binary], history, skip_missing=True)
+                    if batch[0]:
+                        loop.call_soon_threadsafe(found.put_nowait, batch)
             finally:
-                q.task_done()
+                if not stop.is_set():
+                    loop.call_soon_threadsafe(found.put_nowait, None)
 
-    for binary in binaries:
-        q.put(binary)
-    for _ in range(jobs):
-        t = threading.Thread(target=_Worker)
-        t.daemon = True
-        t.start()
-    q.join()
+        scan = loop.run_in_executor(None, _Scan)
+        try:
+            while True:
+                batch = await found.get()
+                if batch is None:
+                    break
+                _Enqueue(q, *batch)
+            await scan
+        except Exception:
+            exceptions.append(traceback.format_exc())
+            raise
+        finally:
+            stop.set()
+        for index in range(jobs):
+            q.put_nowait((math.inf, index, None))
+
+    async def _Run(first_jobs, history):
+        q = asyncio.PriorityQueue()
+        _Enqueue(q, *first_jobs)
+        # Sentinels sort after every job and stop one worker each, so they
+        # are only added once every job is known.
+        tasks = []
+        if binary_stream is not None:
+            tasks.append(asyncio.ensure_future(_Stream(q, history)))
+        else:
+            for index in range(jobs):
+                q.put_nowait((math.inf, index, None))
+        budget = MemoryBudget(max_memory) if max_memory else None
+        workers = tasks + [asyncio.ensure_future(_Worker(q, budget)) for _ in range(jobs)]
+        try:
+            await asyncio.wait(workers, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            # On the first failure, or on Ctrl-C, the remaining workers are
+            # cancelled, which kills their dump_syms processes, and the scan
+            # of |binary_stream| stops.
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    cache = SymbolsCache(symbols_dir) if use_cache else None
+    history = cache.get_runs() if cache else {}
+    first_jobs = _GetDumpJobs(binaries, history)
+    start_time = time.monotonic()
+    use_pidfd_child_watcher()
+    try:
+        asyncio.run(_Run(first_jobs, history))
+    finally:
+        if cache:
+            # Only record binaries whose every slice has its symbol file.
+            jobs_per_binary = collections.Counter(job.binary for job in dump_jobs)
+            for binary, binary_infos in results.items():
+                if len(binary_infos) == jobs_per_binary[binary]:
+                    cache.store(file_keys[binary], binary_infos)
+            cache.close()
+        if shared_cache:
+            shared_cache.trim()
+        if remote_cache:
+            remote_cache.close()
+    if verbose and durations:
+        longest_estimate, longest_job = max(zip(estimates, dump_jobs), key=lambda e: e[0])
+        longest_duration, longest_run = max(durations, key=lambda d: d[0])
+        print(
+            "Critical path: predicted %.1fs (longest job %.1fs, %s), actual %.1fs (longest job %.1fs, %s)"
+            % (
+                get_critical_path(estimates, jobs),
+                longest_estimate,
+                longest_job.binary,
+                time.monotonic() - start_time,
+                longest_duration,
+                longest_run.binary,
+            )
+        )
     if exceptions:
         exception_str = "One or more exceptions occurred while generating " "symbols:\n"
         exception_str += "\n".join(exceptions)
         raise Exception(exception_str)
 
 
+def scan_binaries(root: Path):
+    """Yields the object files found in the tree under |root|, see
+    is_object_file(), as it is walked. Symbolic links to directories are not
+    followed."""
+    directories = [root]
+    while directories:
+        try:
+            with os.scandir(directories.pop()) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if is_object_file(entry.path):
+                yield Path(entry.path)
+
+
+def expand_binary_arguments(args: list):
+    """Returns the binaries named by the command line arguments |args|. An
+    argument can be a binary, a directory, standing for the binaries directly
+    in it, or @file, standing for the arguments listed in file, one per line.
+    Raises FileNotFoundError for arguments that do not exist."""
+    binaries = []
+    for arg in args:
+        if arg.startswith("@"):
+            with open(arg[1:]) as f:
+                lines = [line.strip() for line in f]
+            binaries += expand_binary_arguments([line for line in lines if line and not line.startswith("#")])
+            continue
+        path = Path(arg).resolve()
+        if path.is_dir():
+            with os.scandir(path) as entries:
+                files = sorted(entry.path for entry in entries if entry.is_file())
+            binaries += [Path(f) for f in files if is_object_file(f)]
+        elif path.exists():
+            binaries.append(path)
+        else:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), arg)
+    return binaries
+
+
 def main():
-    usage = "usage: %prog [options] binary symbols_dir"
+    usage = (
+        "usage: %prog [options] binary... symbols_dir\n\n"
+        "Each binary argument can also be a directory, for the binaries it "
+        "contains, or @file, for a list of arguments read from file, one per "
+        "line. Their dependencies are dumped once, by a single pool of jobs. "
+        "With --scan, the binary arguments are optional."
+    )
     parser = optparse.OptionParser(usage=usage)
     parser.add_option("-d", "--dump_syms_path", default=None, help="Path to the dump_syms utility.")
     parser.add_option(
@@ -333,43 +2835,201 @@ def main():
         "--clear",
         default=False,
         action="store_true",
-        help="Clear the symbols directory before writing new " "symbols.",
+        help="Clear the symbols directory before writing new symbols. The old "
+        "symbols are moved aside at once and deleted in the background.",
     )
+    parser.add_option("", "--remove-trash", default=None, metavar="DIR", help=optparse.SUPPRESS_HELP)
     parser.add_option(
         "-j",
         "--jobs",
-        default=CONCURRENT_TASKS,
+        default=None,
         action="store",
         type="int",
-        help="Number of parallel tasks to run.",
+        help="Number of parallel tasks to run. Defaults to the number of "
+        "CPUs this process may use, within its cgroup CPU and memory limits.",
     )
     parser.add_option("-v", "--verbose", action="store_true", help="Print verbose status output.")
     parser.add_option("", "--platform", default=sys.platform, help="Target platform of the binary.")
+    parser.add_option(
+        "",
+        "--single-pass",
+        default=False,
+        action="store_true",
+        help="Run dump_syms once per binary, publishing its output directly "
+        "instead of probing the module header first.",
+    )
+    parser.add_option(
+        "",
+        "--no-cache",
+        dest="use_cache",
+        default=True,
+        action="store_false",
+        help="Do not read or update the identification and dependency caches "
+        "stored in the symbols directory.",
+    )
+    parser.add_option(
+        "",
+        "--timeout",
+        default=None,
+        action="store",
+        type="float",
+        help="Maximum number of seconds to spend generating the symbols of a " "single binary.",
+    )
+    parser.add_option(
+        "",
+        "--max-memory",
+        default=None,
+        action="store",
+        help="Only run as many dump_syms processes at once as their estimated "
+        "memory use fits in this size (e.g. 16G) and in the available memory.",
+    )
+    parser.add_option(
+        "",
+        "--scan",
+        dest="scan_dirs",
+        default=[],
+        action="append",
+        metavar="DIR",
+        help="Also dump every ELF, Mach-O and PE file found under DIR, such as "
+        "plugins that are only loaded at runtime. Dumping starts while the "
+        "tree is still being scanned. Can be given several times.",
+    )
+    parser.add_option(
+        "",
+        "--include",
+        default=[],
+        action="append",
+        metavar="PATTERN",
+        help="Dump the dependencies whose resolved path matches PATTERN: a glob, "
+        "where a directory also matches everything under it, or a regular "
+        'expression prefixed with "re:". Defaults to the parent directory of '
+        "the directory of each binary. Can be given several times.",
+    )
+    parser.add_option(
+        "",
+        "--exclude",
+        default=[],
+        action="append",
+        metavar="PATTERN",
+        help="Do not dump the dependencies whose resolved path matches PATTERN, "
+        "as for --include. Can be given several times.",
+    )
+    parser.add_option(
+        "",
+        "--system-libraries",
+        default=False,
+        action="store_true",
+        help="Also dump the dependencies outside of the included paths, such as system libraries.",
+    )
+    parser.add_option(
+        "",
+        "--shared-cache",
+        default=None,
+        metavar="DIR",
+        help="With --system-libraries, take the symbol files of system libraries "
+        "from DIR, a cache shared by every build on the machine, and add the "
+        "ones that had to be generated to it.",
+    )
+    parser.add_option(
+        "",
+        "--shared-cache-size",
+        default="10G",
+        metavar="SIZE",
+        help="Evict the least recently used symbol files from the shared cache "
+        "once it grows larger than SIZE (e.g. 10G, the default).",
+    )
+    parser.add_option(
+        "",
+        "--remote-cache",
+        default=None,
+        metavar="URL",
+        help="Look up symbol files by the contents of their binary in URL before "
+        "running dump_syms, and store the ones that had to be generated "
+        "there. URL is either an http(s):// URL or a directory, such as a "
+        "network share.",
+    )
     (options, args) = parser.parse_args()
-    if len(args) != 2:
+    sizes = {}
+    for option in ("--max-memory", "--shared-cache-size"):
+        value = getattr(options, option[2:].replace("-", "_"))
+        try:
+            sizes[option] = parse_size(value) if value else None
+        except ValueError as e:
+            parser.error("option %s: %s" % (option, e))
+    if options.remove_trash:
+        # Run by start_removing_trash() in a detached process.
+        remove_trash(Path(options.remove_trash), options.jobs or CONCURRENT_TASKS)
+        return 0
+    if len(args) < (1 if options.scan_dirs else 2):
         parser.print_usage()
         exit(1)
-    binary = Path(args[0]).resolve()
-    if not binary.exists():
-        print("Cannot find %s." % args[0])
+    try:
+        roots = expand_binary_arguments(args[:-1])
+    except FileNotFoundError as e:
+        print("Cannot find %s." % e.filename)
         return 1
-    symbols_dir = Path(args[1]).resolve()
+    scan_dirs = [Path(d).resolve() for d in options.scan_dirs]
+    for scan_dir in scan_dirs:
+        if not scan_dir.is_dir():
+            print("Cannot find %s." % scan_dir)
+            return 1
+    symbols_dir = Path(args[-1]).resolve()
+    dump_syms = get_dump_syms_binary(options.dump_syms_path)
+    if options.jobs is None:
+        options.jobs, reasons = get_default_jobs()
+        if options.verbose:
+            print("Running %d parallel jobs (%s)" % (options.jobs, ", ".join(reasons)))
     if options.clear:
         try:
-            shutil.rmtree(symbols_dir)
-        except:
-            pass
-    dump_syms = get_dump_syms_binary(options.dump_syms_path)
-    # Build the transitive closure of all dependencies.
-    binaries = get_transitive_dependencies(binary, options.platform)
-    generate_symbols(
-        symbols_dir,
-        options.platform,
-        dump_syms,
-        options.jobs,
-        options.verbose,
-        binaries,
-    )
+            move_to_trash(symbols_dir)
+        except OSError:
+            shutil.rmtree(symbols_dir, ignore_errors=True)
+    start_removing_trash(symbols_dir, options.jobs)
+    # Build the transitive closure of all dependencies, reusing the manifest
+    # of the previous run for the binaries that did not change.
+    dependency_filter = None
+    if options.include or options.exclude or options.system_libraries:
+        include = options.include or sorted(set(str(root.parent.parent) for root in roots))
+        dependency_filter = DependencyFilter(include, options.exclude, options.system_libraries)
+    cache = SymbolsCache(symbols_dir) if options.use_cache else None
+    try:
+        binaries = get_all_transitive_dependencies(roots, options.platform, options.jobs, cache, dependency_filter)
+    except BaseException:
+        if cache:
+            cache.close()
+        raise
+    shared_cache = None
+    shared_binaries = set()
+    if options.shared_cache and dependency_filter:
+        shared_cache = SharedSymbolsCache(Path(options.shared_cache).resolve(), sizes["--shared-cache-size"])
+        shared_binaries = set(b for b in binaries if not dependency_filter.is_included(b)) - set(roots)
+    remote_cache = None
+    if options.remote_cache:
+        if urllib.parse.urlsplit(options.remote_cache).scheme in ("http", "https"):
+            backend = HttpSymbolsBackend(options.remote_cache)
+        else:
+            backend = FileSymbolsBackend(Path(options.remote_cache).resolve())
+        remote_cache = RemoteSymbolsCache(backend, dump_syms, min(HASH_THREADS, options.jobs), cache)
+    try:
+        generate_symbols(
+            symbols_dir,
+            options.platform,
+            dump_syms,
+            options.jobs,
+            options.verbose,
+            binaries,
+            options.single_pass,
+            options.use_cache,
+            options.timeout,
+            sizes["--max-memory"],
+            (binary for scan_dir in scan_dirs for binary in scan_binaries(scan_dir)) if scan_dirs else None,
+            shared_cache,
+            shared_binaries,
+            remote_cache,
+        )
+    finally:
+        if cache:
+            cache.close()
     return 0
 
 
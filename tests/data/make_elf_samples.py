@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Writes the minimal ELF samples used by the tests: 64-bit shared libraries
+with a GNU build ID note and a dynamic section, with and without DT_SONAME,
+one with its section headers stripped, and a big-endian one. Only the
+headers, the note and the dynamic section that generate_symbols.py reads
+are written, in a single PT_LOAD segment mapping the file as is."""
+
+import struct
+from pathlib import Path
+
+EM_PPC64 = 21
+EM_X86_64 = 62
+ET_DYN = 3
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_NOTE = 4
+SHT_STRTAB = 3
+SHT_DYNAMIC = 6
+SHT_NOTE = 7
+NT_GNU_BUILD_ID = 3
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_SONAME = 14
+BUILD_ID = bytes(range(0x10, 0x24))
+# File offsets, and virtual addresses, of each part.
+PHDRS_OFFSET = 0x40
+NOTE_OFFSET = 0x100
+DYNSTR_OFFSET = 0x140
+DYNAMIC_OFFSET = 0x180
+SHSTRTAB_OFFSET = 0x200
+SHDRS_OFFSET = 0x240
+
+
+def image(endian: str, machine: int, soname: str = None, strip_sections: bool = False):
+    data = bytearray(SHDRS_OFFSET)
+    note = struct.pack(endian + "III", 4, len(BUILD_ID), NT_GNU_BUILD_ID) + b"GNU\0" + BUILD_ID
+    data[NOTE_OFFSET : NOTE_OFFSET + len(note)] = note
+    dynstr = b"\0libc.so.6\0" + (soname.encode() + b"\0" if soname else b"")
+    data[DYNSTR_OFFSET : DYNSTR_OFFSET + len(dynstr)] = dynstr
+    entries = [(DT_NEEDED, 1)]
+    if soname:
+        entries.append((DT_SONAME, len(b"\0libc.so.6\0")))
+    entries += [(DT_STRTAB, DYNSTR_OFFSET), (DT_NULL, 0)]
+    dynamic = b"".join(struct.pack(endian + "qQ", tag, value) for tag, value in entries)
+    data[DYNAMIC_OFFSET : DYNAMIC_OFFSET + len(dynamic)] = dynamic
+    section_names = b"\0.note.gnu.build-id\0.dynstr\0.dynamic\0.shstrtab\0"
+    data[SHSTRTAB_OFFSET : SHSTRTAB_OFFSET + len(section_names)] = section_names
+
+    def _Name(name):
+        return section_names.index(name.encode() + b"\0")
+
+    # Sections as (name, type, offset, size, link, alignment).
+    sections = [
+        (0, 0, 0, 0, 0, 0),
+        (_Name(".note.gnu.build-id"), SHT_NOTE, NOTE_OFFSET, len(note), 0, 4),
+        (_Name(".dynstr"), SHT_STRTAB, DYNSTR_OFFSET, len(dynstr), 0, 1),
+        (_Name(".dynamic"), SHT_DYNAMIC, DYNAMIC_OFFSET, len(dynamic), 2, 8),
+        (_Name(".shstrtab"), SHT_STRTAB, SHSTRTAB_OFFSET, len(section_names), 0, 1),
+    ]
+    if strip_sections:
+        sections = []
+    for name, sh_type, offset, size, link, align in sections:
+        entry_size = 16 if sh_type == SHT_DYNAMIC else 0
+        data += struct.pack(endian + "IIQQQQIIQQ", name, sh_type, 0, offset, offset, size, link, 0, align, entry_size)
+    # Segments as (type, offset, size, alignment).
+    segments = [
+        (PT_LOAD, 0, len(data), 0x1000),
+        (PT_DYNAMIC, DYNAMIC_OFFSET, len(dynamic), 8),
+        (PT_NOTE, NOTE_OFFSET, len(note), 4),
+    ]
+    for i, (p_type, offset, size, align) in enumerate(segments):
+        phdr = struct.pack(endian + "IIQQQQQQ", p_type, 4, offset, offset, offset, size, size, align)
+        data[PHDRS_OFFSET + i * len(phdr) : PHDRS_OFFSET + (i + 1) * len(phdr)] = phdr
+    ident = b"\x7fELF" + bytes([2, 1 if endian == "<" else 2, 1]) + bytes(9)
+    header = ident + struct.pack(
+        endian + "HHIQQQIHHHHHH",
+        ET_DYN,
+        machine,
+        1,
+        0,
+        PHDRS_OFFSET,
+        SHDRS_OFFSET if sections else 0,
+        0,
+        64,
+        56,
+        len(segments),
+        64,
+        len(sections),
+        len(sections) - 1 if sections else 0,
+    )
+    data[: len(header)] = header
+    return bytes(data)
+
+
+def main():
+    directory = Path(__file__).parent
+    (directory / "libsample.so.1").write_bytes(image("<", EM_X86_64, soname="libsample.so.1"))
+    (directory / "libsample-nosoname.so.1").write_bytes(image("<", EM_X86_64))
+    (directory / "libsample-stripped.so.1").write_bytes(
+        image("<", EM_X86_64, soname="libsample.so.1", strip_sections=True)
+    )
+    (directory / "libsample-ppc64.so.1").write_bytes(image(">", EM_PPC64, soname="libsample.so.1"))
+
+
+if __name__ == "__main__":
+    main()
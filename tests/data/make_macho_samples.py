@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Writes the minimal Mach-O samples used by the tests: a thin x86_64 dylib,
+and two universal dylibs with x86_64 and arm64 slices, one with a 32-bit and
+one with a 64-bit fat header. Only the header and the load commands that
+generate_symbols.py reads are written."""
+
+import struct
+from pathlib import Path
+
+MH_MAGIC_64 = 0xFEEDFACF
+FAT_MAGIC = 0xCAFEBABE
+FAT_MAGIC_64 = 0xCAFEBABF
+MH_DYLIB = 6
+LC_LOAD_DYLIB = 0xC
+LC_ID_DYLIB = 0xD
+LC_UUID = 0x1B
+LC_LOAD_WEAK_DYLIB = 0x80000018
+LC_RPATH = 0x8000001C
+CPU_TYPE_X86_64 = 0x01000007
+CPU_TYPE_ARM64 = 0x0100000C
+CPU_SUBTYPE_ARM64E = 2
+SLICE_ALIGN = 12
+
+
+def path_command(cmd: int, path: str, header_size: int):
+    path = path.encode("utf-8") + b"\0"
+    size = (header_size + len(path) + 7) & ~7
+    header = struct.pack("<III", cmd, size, header_size)
+    if header_size > 12:
+        # dylib_command: timestamp, current_version and compatibility_version.
+        header += struct.pack("<III", 2, 0x10000, 0x10000)
+    return (header + path).ljust(size, b"\0")
+
+
+def image(cputype: int, cpusubtype: int, uuid: str, dylibs, weak_dylibs=(), rpaths=()):
+    commands = [
+        path_command(LC_ID_DYLIB, "@rpath/libsample.dylib", 24),
+        struct.pack("<II", LC_UUID, 24) + bytes.fromhex(uuid),
+    ]
+    commands += [path_command(LC_RPATH, rpath, 12) for rpath in rpaths]
+    commands += [path_command(LC_LOAD_DYLIB, name, 24) for name in dylibs]
+    commands += [path_command(LC_LOAD_WEAK_DYLIB, name, 24) for name in weak_dylibs]
+    data = b"".join(commands)
+    header = struct.pack("<IiiIIIII", MH_MAGIC_64, cputype, cpusubtype, MH_DYLIB, len(commands), len(data), 0, 0)
+    return header + data
+
+
+def universal(slices, is_64: bool):
+    arch_size = 32 if is_64 else 20
+    offset = (8 + len(slices) * arch_size + (1 << SLICE_ALIGN) - 1) & ~((1 << SLICE_ALIGN) - 1)
+    header = struct.pack(">II", FAT_MAGIC_64 if is_64 else FAT_MAGIC, len(slices))
+    body = b""
+    for cputype, cpusubtype, data in slices:
+        body = body.ljust((len(body) + (1 << SLICE_ALIGN) - 1) & ~((1 << SLICE_ALIGN) - 1), b"\0")
+        if is_64:
+            header += struct.pack(">iiQQII", cputype, cpusubtype, offset + len(body), len(data), SLICE_ALIGN, 0)
+        else:
+            header += struct.pack(">iiIII", cputype, cpusubtype, offset + len(body), len(data), SLICE_ALIGN)
+        body += data
+    return header.ljust(offset, b"\0") + body
+
+
+def main():
+    directory = Path(__file__).parent
+    x86_64 = image(
+        CPU_TYPE_X86_64,
+        3,
+        "0123456789abcdef0011223344556677",
+        ["/usr/lib/libSystem.B.dylib", "@rpath/libfoo.dylib"],
+        rpaths=["@loader_path/../lib"],
+    )
+    arm64 = image(
+        CPU_TYPE_ARM64,
+        0,
+        "fedcba98765432100f1e2d3c4b5a6978",
+        ["/usr/lib/libSystem.B.dylib", "@rpath/libfoo.dylib"],
+        weak_dylibs=["@rpath/libbar.dylib"],
+        rpaths=["@loader_path/../lib", "@executable_path/Frameworks"],
+    )
+    arm64e = image(CPU_TYPE_ARM64, CPU_SUBTYPE_ARM64E, "00112233445566778899aabbccddeeff", ["/usr/lib/libc++.1.dylib"])
+    (directory / "thin.dylib").write_bytes(x86_64)
+    (directory / "fat.dylib").write_bytes(universal([(CPU_TYPE_X86_64, 3, x86_64), (CPU_TYPE_ARM64, 0, arm64)], False))
+    (directory / "fat64.dylib").write_bytes(
+        universal([(CPU_TYPE_X86_64, 3, x86_64), (CPU_TYPE_ARM64, CPU_SUBTYPE_ARM64E, arm64e)], True)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Writes the minimal PE samples used by the tests: a PE32+ x86_64 executable
+with a CodeView (RSDS) debug record, import and delay-load import tables,
+and a PE32 x86 DLL without debug record. Only the headers and the tables
+that generate_symbols.py reads are written, in a single section."""
+
+import struct
+from pathlib import Path
+
+PE32_MAGIC = 0x10B
+PE32_PLUS_MAGIC = 0x20B
+IMAGE_FILE_MACHINE_I386 = 0x14C
+IMAGE_FILE_MACHINE_AMD64 = 0x8664
+IMAGE_DIRECTORY_ENTRY_IMPORT = 1
+IMAGE_DIRECTORY_ENTRY_DEBUG = 6
+IMAGE_DIRECTORY_ENTRY_DELAY_IMPORT = 13
+IMAGE_DEBUG_TYPE_CODEVIEW = 2
+NUMBER_OF_DIRECTORIES = 16
+SECTION_RVA = 0x1000
+SECTION_OFFSET = 0x200
+SECTION_SIZE = 0x400
+# Offsets in the section of each table.
+IMPORTS_OFFSET = 0x0
+DELAY_IMPORTS_OFFSET = 0x100
+DEBUG_OFFSET = 0x180
+CODEVIEW_OFFSET = 0x1C0
+NAMES_OFFSET = 0x280
+
+
+def image(machine: int, is_64: bool, imports=(), delay_imports=(), guid: bytes = None, age: int = 0, pdb_path=""):
+    section = bytearray(SECTION_SIZE)
+    directories = [(0, 0)] * NUMBER_OF_DIRECTORIES
+    name_offset = NAMES_OFFSET
+    names = {}
+    for name in list(imports) + list(delay_imports):
+        names[name] = SECTION_RVA + name_offset
+        section[name_offset : name_offset + len(name) + 1] = name.encode() + b"\0"
+        name_offset += len(name) + 1
+    if imports:
+        # IMAGE_IMPORT_DESCRIPTORs, with the name RVA at offset 12.
+        table = b"".join(struct.pack("<IIIII", 0, 0, 0, names[name], 0) for name in imports) + bytes(20)
+        section[IMPORTS_OFFSET : IMPORTS_OFFSET + len(table)] = table
+        directories[IMAGE_DIRECTORY_ENTRY_IMPORT] = (SECTION_RVA + IMPORTS_OFFSET, len(table))
+    if delay_imports:
+        # IMAGE_DELAYLOAD_DESCRIPTORs, with the name RVA at offset 4.
+        table = b"".join(struct.pack("<IIIIIIII", 1, names[name], 0, 0, 0, 0, 0, 0) for name in delay_imports)
+        table += bytes(32)
+        section[DELAY_IMPORTS_OFFSET : DELAY_IMPORTS_OFFSET + len(table)] = table
+        directories[IMAGE_DIRECTORY_ENTRY_DELAY_IMPORT] = (SECTION_RVA + DELAY_IMPORTS_OFFSET, len(table))
+    if guid:
+        record = b"RSDS" + guid + struct.pack("<I", age) + pdb_path.encode() + b"\0"
+        section[CODEVIEW_OFFSET : CODEVIEW_OFFSET + len(record)] = record
+        # IMAGE_DEBUG_DIRECTORY: characteristics, timestamp, versions, type,
+        # size, RVA and file offset of the data.
+        entry = struct.pack(
+            "<IIHHIIII",
+            0,
+            0,
+            0,
+            0,
+            IMAGE_DEBUG_TYPE_CODEVIEW,
+            len(record),
+            SECTION_RVA + CODEVIEW_OFFSET,
+            SECTION_OFFSET + CODEVIEW_OFFSET,
+        )
+        section[DEBUG_OFFSET : DEBUG_OFFSET + len(entry)] = entry
+        directories[IMAGE_DIRECTORY_ENTRY_DEBUG] = (SECTION_RVA + DEBUG_OFFSET, len(entry))
+
+    # Only the magic, the number of directories and the directories of the
+    # optional header are read, the rest is left zeroed.
+    directories_offset = 112 if is_64 else 96
+    optional = bytearray(directories_offset + NUMBER_OF_DIRECTORIES * 8)
+    struct.pack_into("<H", optional, 0, PE32_PLUS_MAGIC if is_64 else PE32_MAGIC)
+    struct.pack_into("<I", optional, directories_offset - 4, NUMBER_OF_DIRECTORIES)
+    for i, (rva, size) in enumerate(directories):
+        struct.pack_into("<II", optional, directories_offset + i * 8, rva, size)
+    dos_header = bytearray(0x40)
+    dos_header[:2] = b"MZ"
+    struct.pack_into("<I", dos_header, 0x3C, len(dos_header))
+    coff_header = b"PE\0\0" + struct.pack("<HHIIIHH", machine, 1, 0, 0, 0, len(optional), 0)
+    section_header = struct.pack(
+        "<8sIIIIIIHHI", b".rdata", SECTION_SIZE, SECTION_RVA, SECTION_SIZE, SECTION_OFFSET, 0, 0, 0, 0, 0
+    )
+    headers = bytes(dos_header) + coff_header + bytes(optional) + section_header
+    return headers.ljust(SECTION_OFFSET, b"\0") + bytes(section)
+
+
+def main():
+    directory = Path(__file__).parent
+    (directory / "sample.exe").write_bytes(
+        image(
+            IMAGE_FILE_MACHINE_AMD64,
+            True,
+            imports=["KERNEL32.dll", "api-ms-win-crt-runtime-l1-1-0.dll", "sample.dll"],
+            delay_imports=["delayed.DLL"],
+            guid=bytes(range(16)),
+            age=0x1A,
+            pdb_path="C:\\build\\out\\CrashpadDemo.pdb",
+        )
+    )
+    (directory / "sample32.dll").write_bytes(image(IMAGE_FILE_MACHINE_I386, False, imports=["KERNEL32.dll"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import sys
+import unittest
+from pathlib import Path
+
+import generate_symbols
+
+# The samples are written by data/make_elf_samples.py, with the build ID
+# 101112...2223.
+DATA_DIR = Path(__file__).parent / "data"
+# dump_syms swaps the first three fields of the build ID with htonl() and
+# htons(), i.e. only on little-endian hosts, whatever the byte order of the
+# file, and appends an age of 0.
+if sys.byteorder == "little":
+    MODULE_ID = "13121110" "1514" "1716" "18191A1B1C1D1E1F" "0"
+else:
+    MODULE_ID = "10111213" "1415" "1617" "18191A1B1C1D1E1F" "0"
+
+
+class ELFTest(unittest.TestCase):
+    def assertBinaryInfo(self, name, arch, module_name):
+        binary_infos = generate_symbols.get_binary_infos_from_file(DATA_DIR / name)
+        self.assertEqual(binary_infos, [generate_symbols.BINARY_INFO("Linux", arch, MODULE_ID, module_name)])
+
+    def testNamedAfterSoname(self):
+        self.assertBinaryInfo("libsample.so.1", "x86_64", "libsample.so.1")
+
+    def testNamedAfterFileWithoutSoname(self):
+        self.assertBinaryInfo("libsample-nosoname.so.1", "x86_64", "libsample-nosoname.so.1")
+
+    def testStrippedSectionHeaders(self):
+        # The build ID and DT_SONAME are then found through PT_NOTE and
+        # PT_DYNAMIC.
+        self.assertBinaryInfo("libsample-stripped.so.1", "x86_64", "libsample.so.1")
+
+    def testBigEndianFileIsSwappedByHostOrder(self):
+        self.assertBinaryInfo("libsample-ppc64.so.1", "ppc64", "libsample.so.1")
+
+    def testNoBuildId(self):
+        data = bytearray((DATA_DIR / "libsample.so.1").read_bytes())
+        # Turn the build ID note into another note type.
+        data[0x108] = 1
+        elf = generate_symbols.parse_elf(bytes(data))
+        self.assertIsNone(generate_symbols.get_binary_info_from_elf(Path("libsample.so.1"), elf))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from pathlib import Path
+
+import generate_symbols
+
+# The samples are written by data/make_macho_samples.py.
+DATA_DIR = Path(__file__).parent / "data"
+THIN_X86_64_ID = "0123456789ABCDEF00112233445566770"
+FAT_ARM64_ID = "FEDCBA98765432100F1E2D3C4B5A69780"
+FAT64_ARM64E_ID = "00112233445566778899AABBCCDDEEFF0"
+
+
+class MachOTest(unittest.TestCase):
+    def assertBinaryInfos(self, name, expected):
+        binary_infos = generate_symbols.get_binary_infos_from_file(DATA_DIR / name)
+        self.assertEqual(binary_infos, [generate_symbols.BINARY_INFO("mac", arch, id, name) for arch, id in expected])
+
+    def testThinBinaryInfo(self):
+        self.assertBinaryInfos("thin.dylib", [("x86_64", THIN_X86_64_ID)])
+
+    def testFatBinaryInfos(self):
+        self.assertBinaryInfos("fat.dylib", [("x86_64", THIN_X86_64_ID), ("arm64", FAT_ARM64_ID)])
+
+    def testFat64BinaryInfos(self):
+        self.assertBinaryInfos("fat64.dylib", [("x86_64", THIN_X86_64_ID), ("arm64e", FAT64_ARM64E_ID)])
+
+    def testTruncatedSlice(self):
+        data = (DATA_DIR / "fat.dylib").read_bytes()
+        self.assertEqual(generate_symbols.get_binary_infos_from_macho(Path("fat.dylib"), data[:4200]), [])
+
+    def testNotMachO(self):
+        self.assertEqual(generate_symbols.get_binary_infos_from_file(Path(__file__)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
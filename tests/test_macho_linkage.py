@@ -0,0 +1,36 @@
+import unittest
+from pathlib import Path
+
+import generate_symbols
+
+# The samples are written by data/make_macho_samples.py.
+DATA_DIR = Path(__file__).parent / "data"
+
+
+class MachOLinkageTest(unittest.TestCase):
+    def testThinLinkage(self):
+        linkage = generate_symbols.read_macho_linkage(DATA_DIR / "thin.dylib")
+        self.assertEqual(linkage.dylib_id, "@rpath/libsample.dylib")
+        self.assertEqual(linkage.rpaths, ["@loader_path/../lib"])
+        self.assertEqual(linkage.dylibs, ["/usr/lib/libSystem.B.dylib", "@rpath/libfoo.dylib"])
+
+    def testFatLinkageMergesSlices(self):
+        linkage = generate_symbols.read_macho_linkage(DATA_DIR / "fat.dylib")
+        self.assertEqual(linkage.dylib_id, "@rpath/libsample.dylib")
+        self.assertEqual(linkage.rpaths, ["@loader_path/../lib", "@executable_path/Frameworks"])
+        self.assertEqual(
+            linkage.dylibs, ["/usr/lib/libSystem.B.dylib", "@rpath/libfoo.dylib", "@rpath/libbar.dylib"]
+        )
+
+    def testFat64Linkage(self):
+        linkage = generate_symbols.read_macho_linkage(DATA_DIR / "fat64.dylib")
+        self.assertEqual(
+            linkage.dylibs, ["/usr/lib/libSystem.B.dylib", "@rpath/libfoo.dylib", "/usr/lib/libc++.1.dylib"]
+        )
+
+    def testNotMachO(self):
+        self.assertIsNone(generate_symbols.read_macho_linkage(Path(__file__)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,20 @@
+import unittest
+
+import generate_symbols
+
+
+class ParseSizeTest(unittest.TestCase):
+    def testSuffixes(self):
+        self.assertEqual(generate_symbols.parse_size("100"), 100)
+        self.assertEqual(generate_symbols.parse_size("1.5k"), 1536)
+        self.assertEqual(generate_symbols.parse_size("16G"), 16 * 1024**3)
+        self.assertEqual(generate_symbols.parse_size(" 2TB "), 2 * 1024**4)
+
+    def testInvalidSizes(self):
+        for size in ("", "16X", "abc", "G", "nan", "inf", "-1G"):
+            with self.subTest(size=size), self.assertRaises(ValueError):
+                generate_symbols.parse_size(size)
+
+
+if __name__ == "__main__":
+    unittest.main()
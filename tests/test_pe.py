@@ -0,0 +1,42 @@
+import unittest
+from pathlib import Path
+
+import generate_symbols
+
+# The samples are written by data/make_pe_samples.py.
+DATA_DIR = Path(__file__).parent / "data"
+
+
+class PETest(unittest.TestCase):
+    def testCodeViewBinaryInfo(self):
+        binary_infos = generate_symbols.get_binary_infos_from_file(DATA_DIR / "sample.exe")
+        # The first three fields of the GUID are stored little-endian and
+        # printed big-endian, followed by the age in lowercase hexadecimal.
+        expected = "03020100" "0504" "0706" "08090A0B0C0D0E0F" "1a"
+        binary_info = generate_symbols.BINARY_INFO("windows", "x86_64", expected, "CrashpadDemo.pdb")
+        self.assertEqual(binary_infos, [binary_info])
+
+    def testNoCodeViewRecord(self):
+        self.assertEqual(generate_symbols.get_binary_infos_from_file(DATA_DIR / "sample32.dll"), [])
+
+    def testParseHeaders(self):
+        data = (DATA_DIR / "sample32.dll").read_bytes()
+        pe = generate_symbols.parse_pe(data)
+        self.assertEqual(pe.machine, 0x14C)
+        self.assertEqual([section.name for section in pe.sections], [".rdata"])
+        self.assertIsNone(generate_symbols.parse_pe(data[:0x80]))
+        self.assertIsNone(generate_symbols.parse_pe(b"MZ" + bytes(0x3E)))
+
+    def testImports(self):
+        self.assertEqual(
+            generate_symbols.read_pe_imports(DATA_DIR / "sample.exe"),
+            ["KERNEL32.dll", "api-ms-win-crt-runtime-l1-1-0.dll", "sample.dll", "delayed.DLL"],
+        )
+        self.assertEqual(generate_symbols.read_pe_imports(DATA_DIR / "sample32.dll"), ["KERNEL32.dll"])
+
+    def testNotPE(self):
+        self.assertEqual(generate_symbols.read_pe_imports(Path(__file__)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import asyncio
+import contextlib
+import http.client
+import http.server
+import io
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from pathlib import Path
+
+import generate_symbols
+
+SYMBOL_FILE = b"MODULE Linux x86_64 0123456789ABCDEF0123456789ABCDEF0 sample\nFILE 0 sample.c\n"
+BINARY_INFO = generate_symbols.BINARY_INFO("Linux", "x86_64", "0123456789ABCDEF0123456789ABCDEF0", "sample")
+
+
+class SymbolsServer(http.server.ThreadingHTTPServer):
+    """Local stand-in for a remote symbols cache, storing the entries in
+    memory. Requests are logged as (method, path), and PUT answers
+    |put_status| when it is set."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SymbolsHandler)
+        self.entries = {}
+        self.requests = []
+        self.connections = 0
+        self.put_status = None
+
+
+class SymbolsHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def _send(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path))
+        body = self.server.entries.get(self.path)
+        if body is None:
+            self._send(404)
+        else:
+            self._send(200, body)
+
+    def do_PUT(self):
+        self.server.requests.append(("PUT", self.path))
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.server.put_status:
+            self._send(self.server.put_status)
+            return
+        self.server.entries[self.path] = body
+        self._send(201)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RemoteSymbolsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = SymbolsServer()
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.backend = generate_symbols.HttpSymbolsBackend("http://127.0.0.1:%d/symbols/" % self.server.server_port)
+        self.addCleanup(self.backend.close)
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = Path(temp_dir.name)
+        self.symbol_file = self.temp_dir / "sample.sym"
+        self.symbol_file.write_bytes(SYMBOL_FILE)
+
+    def testMissIsASingleGet(self):
+        self.assertFalse(self.backend.get("key", io.BytesIO()))
+        self.assertEqual(self.server.requests, [("GET", "/symbols/key")])
+
+    def testPutThenGetReusesTheConnection(self):
+        self.backend.put("key", self.symbol_file)
+        f = io.BytesIO()
+        self.assertTrue(self.backend.get("key", f))
+        self.assertEqual(f.getvalue(), SYMBOL_FILE)
+        self.assertEqual(self.server.requests, [("PUT", "/symbols/key"), ("GET", "/symbols/key")])
+        self.assertEqual(self.server.connections, 1)
+
+    def testPutFailure(self):
+        self.server.put_status = 403
+        with self.assertRaises(http.client.HTTPException):
+            self.backend.put("key", self.symbol_file)
+        self.assertEqual(self.server.entries, {})
+
+    def testStoreReportsFailures(self):
+        self.server.put_status = 500
+        cache = generate_symbols.RemoteSymbolsCache(self.backend, None, 1)
+        self.addCleanup(cache.close)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            cache.store("key", self.symbol_file)
+        self.assertIn("Could not store", output.getvalue())
+
+    def testStoreThenFetch(self):
+        cache = generate_symbols.RemoteSymbolsCache(self.backend, None, 1)
+        self.addCleanup(cache.close)
+        binary = self.temp_dir / "sample"
+        binary.write_bytes(b"binary")
+        key = asyncio.run(cache.get_key(binary, ["-a", "x86_64"]))
+        self.assertNotEqual(key, asyncio.run(cache.get_key(binary)))
+        symbols_dir = self.temp_dir / "symbols"
+        self.assertIsNone(cache.fetch(key, symbols_dir))
+        cache.store(key, self.symbol_file)
+        other_info = BINARY_INFO._replace(hash="F" * 33)
+        self.assertIsNone(cache.fetch(key, symbols_dir, other_info))
+        self.assertEqual(cache.fetch(key, symbols_dir, BINARY_INFO), BINARY_INFO)
+        output_path = generate_symbols.get_symbol_file_path(symbols_dir, BINARY_INFO)
+        self.assertEqual(output_path.read_bytes(), SYMBOL_FILE)
+
+    def testHashesPersistAcrossRuns(self):
+        cache = generate_symbols.SymbolsCache(self.temp_dir / "symbols")
+        self.addCleanup(cache.close)
+        binary = self.temp_dir / "sample"
+        binary.write_bytes(b"binary")
+        hasher = generate_symbols.FileHasher(1, cache)
+        digest = hasher.submit(binary).result()
+        hasher.close()
+        self.assertEqual(digest, generate_symbols.hash_file(binary))
+        with mock.patch.object(generate_symbols, "hash_file", side_effect=AssertionError("hashed again")):
+            hasher = generate_symbols.FileHasher(1, cache)
+            self.assertEqual(hasher.submit(binary).result(), digest)
+            hasher.close()
+        binary.write_bytes(b"rebuilt binary")
+        hasher = generate_symbols.FileHasher(1, cache)
+        self.assertEqual(hasher.submit(binary).result(), generate_symbols.hash_file(binary))
+        hasher.close()
+
+    def testUnreadableBinaryIsAMiss(self):
+        cache = generate_symbols.RemoteSymbolsCache(self.backend, Path("no-such-dump_syms"), 1)
+        self.addCleanup(cache.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertIsNone(asyncio.run(cache.get_key(self.symbol_file)))
+            self.assertIsNone(asyncio.run(cache.get_key(self.temp_dir / "missing")))
+        self.assertEqual(self.server.requests, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+from pathlib import Path
+
+import generate_symbols
+
+
+class SymbolFilePathTest(unittest.TestCase):
+    def assertSymbolFilePath(self, name, expected):
+        binary_info = generate_symbols.BINARY_INFO("Linux", "x86_64", "0123456789ABCDEF0123456789ABCDEF0", name)
+        path = generate_symbols.get_symbol_file_path(Path("symbols"), binary_info)
+        self.assertEqual(path, Path("symbols", name, binary_info.hash, expected))
+
+    def testSharedLibraryKeepsItsExtensions(self):
+        self.assertSymbolFilePath("libfoo.so.1", "libfoo.so.1.sym")
+        self.assertSymbolFilePath("libfoo.so", "libfoo.so.sym")
+        self.assertSymbolFilePath("libfoo.dylib", "libfoo.dylib.sym")
+
+    def testExecutable(self):
+        self.assertSymbolFilePath("crashpaddemo", "crashpaddemo.sym")
+
+    def testPdbExtensionIsDropped(self):
+        self.assertSymbolFilePath("crashpaddemo.pdb", "crashpaddemo.sym")
+        self.assertSymbolFilePath("CRASHPADDEMO.PDB", "CRASHPADDEMO.sym")
+
+
+if __name__ == "__main__":
+    unittest.main()